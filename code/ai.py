@@ -1,100 +1,387 @@
-import random
+import os
 import time
-from board import Board
-from pieces import Piece
-from settings import *
+from position import PAWN, QUEEN
+from evaluation import MIDGAME_VALUES, evaluate
+from book import OpeningBook
+from tablebase import Tablebase, WIN, LOSS
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
 
+INFINITY = 10 ** 9
+MATE_SCORE = 10 ** 7
+MATE_BOUND = MATE_SCORE - 1000  # scores beyond this are mates, their distance is stored relative to the node
+MAX_PLY = 128
+
+# move ordering keys: hash move, then captures and queen promotions by MVV-LVA, killers and quiet moves by history
+HASH_MOVE_ORDER = 1 << 30
+CAPTURE_ORDER = 1 << 28
+KILLER_ORDER = 1 << 27
+HISTORY_LIMIT = 1 << 26  # the history table is halved when a value gets this large
+
+# a capture is skipped in the quiescence search when even winning the piece plus this margin cannot reach alpha
+DELTA_MARGIN = 200
+
+
+def score_to_table(score, ply):
+    """ Mate scores are stored as the distance from the stored node instead of from the root """
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
 
-class AI:
-    PIECE_VALUES = {
-        'pawn': 1, 'knight': 3, 'bishop': 3, 'rook': 5, 'queen': 9, 'king': 100000,
-    }
 
-    def __init__(self, color, engine, depth=1):
-        """ Initialize AI with the color it will play (white or black) and the engine instance """
+def score_from_table(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class SearchAborted(Exception):
+    """ Raised inside the search when the time budget or the node limit is used up """
+
+
+class AI:
+    def __init__(self, color, depth=4, time_limit=None, node_limit=None, hash_size=16,
+                 quiescence_node_limit=1000, book_path=None, tablebase_path=None):
+        """ Initialize AI with the color it will play (white or black) """
         self.color = color
-        self.engine = engine  # Reference to the game engine to access board state, FEN, etc.
-        self.depth = depth
+        self.depth = depth  # maximum depth of the iterative deepening
+        self.time_limit = time_limit  # seconds per move, None searches until the depth is reached
+        self.node_limit = node_limit
+        self.quiescence_node_limit = quiescence_node_limit  # nodes of the capture search per leaf, None is unlimited
+        self.stop_event = None  # set from outside to end the search early, e.g. a multiprocessing.Event
+        self.info_callback = None  # called with the search info after every completed iteration
         self.pos_evaluated_count = 0
+        self.transposition_table = TranspositionTable(hash_size)  # size in MB, kept for the whole game
+        # book moves are played without searching, a missing book file just means no book
+        self.book = OpeningBook(book_path) if book_path and os.path.exists(book_path) else None
+        # exact results once only a few pieces are left, the tables are loaded when first probed
+        self.tablebase = Tablebase(tablebase_path) if tablebase_path else None
 
-    def copy_board(self, board):
-        """Creates a new board with pieces at the same positions as the current board"""
-        new_board = Board(self.engine.board.images)  # Create a new board instance
-
-        new_board.square = [None] * 64
-
-        # Iterate through the original board's pieces and replicate them on the new board
-        for index, piece in enumerate(board.square):
-            if piece:
-                pos = (index % 8, index // 8)
-                new_piece = Piece(
-                    name=f"{piece.color}_{piece.type}",
-                    surf=piece.surf,
-                    group=(new_board.all_pieces, new_board.white_pieces if piece.color == 'white'
-                           else new_board.black_pieces),
-                    pos=pos,
-                    allied_pieces=new_board.white_pieces if piece.color == 'white' else new_board.black_pieces,
-                    opponent_pieces=new_board.black_pieces if piece.color == 'white' else new_board.white_pieces)
-                new_board.square[index] = new_piece
-
-        # Copy other important attributes like castling rights, en passant, etc.
-        new_board.pawn_promotion = board.pawn_promotion
-        new_board.en_passant_target = board.en_passant_target
-        new_board.half_move = board.half_move
-        new_board.full_move = board.full_move
-
-        return new_board
-
-    def evaluate_board(self, board):
-        """ Evaluate the board based on material values of the pieces """
+        # search state
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.quiescence_budget = None
+        self.transposition_table.reset_stats()
+        self.deadline = None
+        self.best_move = None
+        self.best_score = 0
+        self.completed_depth = 0
+        self.elapsed_time = 0.0
+        self.book_move = False
+        self.tablebase_move = False
+        self.tablebase_hits = 0
+        self.principal_variation = []
+
+        # move ordering, killers are two quiet moves per ply that caused a cutoff, history is per piece and target
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [0] * (12 * 64)
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def evaluate(self, position):
+        """ Score of the position from the view of the side to move, the terms are kept up to date by push """
         self.pos_evaluated_count += 1
-        score = 0
-        for row in range(DIMENSION):
-            for col in range(DIMENSION):
-                piece = board.square[row * 8 + col]
-                if piece:
-                    # Add value of piece, negative for opponent pieces
-                    piece_value = self.PIECE_VALUES[piece.type]
-                    if piece.color == self.color:
-                        score += piece_value
-                    else:
-                        score -= piece_value
-        return score
-
-    def find_best_move(self):
-        all_chosen_moves = []  # List to store all chosen moves (only moves)
-
-        # Iterate over each piece of the current color
-        for piece in self.engine.board.white_pieces if self.color == 'white' else self.engine.board.black_pieces:
-            # Generate legal moves for the piece
-            legal_moves = piece.generate_legal_moves(self.engine.board.square,
-                                                     'white' if self.color == 'black' else 'black')
-
-            # If there are legal moves available for the piece
-            if legal_moves:
-                # Choose a random move from the legal moves
-                chosen_move = random.choice(legal_moves)
-                all_chosen_moves.append(chosen_move)  # Add only the chosen move to the list
-
-        # Randomly select one of the chosen moves
-        best_move = random.choice(all_chosen_moves)
-
-        # Find the piece that made the best_move (if needed)
-        best_piece = None
-        for piece in self.engine.board.white_pieces if self.color == 'white' else self.engine.board.black_pieces:
-            if best_move in piece.generate_legal_moves(self.engine.board.square,
-                                                       'white' if self.color == 'black' else 'black'):
-                best_piece = piece
-                break  # Exit once we find the piece that can make this move
-
-        return best_piece, best_move, all_chosen_moves  # Return the selected piece, move, and all chosen moves
-
-    def make_move(self):
-        """ Execute the best move found by the AI """
-        start_time = time.time()
-        best_piece, best_move, legal_moves = self.find_best_move()
-        elapsed_time = time.time() - start_time
-        if best_piece and best_move:
-            self.engine.board.make_move(best_piece, best_move[0], best_move[1], legal_moves)
-        # print(f"Positions evaluated: {self.pos_evaluated_count}, Time taken: {elapsed_time:.9f} seconds")
-        self.pos_evaluated_count = 0
+        return evaluate(position)
+
+    def check_limits(self):
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchAborted
+        if not (self.nodes + self.quiescence_nodes) & 255:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchAborted
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise SearchAborted
+
+    def find_best_move(self, position):
+        """ Iterative deepening search, returns the best move of the deepest completed iteration """
+        # search on a copy, an aborted search leaves moves on the stack
+        position = position.copy()
+        moves = list(position.cached_legal_moves())  # usually generated already by the game-over check
+        if not moves:
+            return None
+
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.transposition_table.reset_stats()
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [value >> 1 for value in self.history]  # older searches count less
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.order_moves(position, moves, 0, 0)
+        start_time = time.perf_counter()
+        self.deadline = start_time + self.time_limit if self.time_limit is not None else None
+        self.best_move = moves[0]
+        self.best_score = 0
+        self.completed_depth = 0
+        self.book_move = False
+        self.tablebase_move = False
+        self.tablebase_hits = 0
+        self.principal_variation = []
+
+        if self.tablebase and self.choose_tablebase_move(position, moves):
+            self.tablebase_move = True
+            self.elapsed_time = time.perf_counter() - start_time
+            return self.best_move
+
+        if self.book:
+            move = self.book.choose_move(position)
+            if move is not None:
+                self.best_move = move
+                self.book_move = True
+                self.elapsed_time = time.perf_counter() - start_time
+                return move
+
+        for depth in range(1, self.depth + 1):
+            # search the best move of the previous iteration first
+            moves.remove(self.best_move)
+            moves.insert(0, self.best_move)
+            try:
+                self.search_root(position, moves, depth)
+            except SearchAborted:
+                break
+            self.completed_depth = depth
+            self.principal_variation = self.extract_principal_variation(position, depth)
+            self.elapsed_time = time.perf_counter() - start_time
+            if self.info_callback:
+                self.info_callback(self.search_info())
+            if abs(self.best_score) >= MATE_SCORE - depth:
+                break  # a forced mate was found, searching deeper does not change the move
+        self.elapsed_time = time.perf_counter() - start_time
+        return self.best_move
+
+    def extract_principal_variation(self, position, length):
+        """ The expected line of play, the best move followed by the hash moves of the positions after it """
+        line = [self.best_move]
+        position.push(self.best_move)
+        while len(line) < length and position.repetitions[position.hash] == 1:
+            entry = self.transposition_table.probe(position.hash)
+            if not entry or entry[3] not in position.legal_moves():
+                break
+            line.append(entry[3])
+            position.push(entry[3])
+        for _ in line:
+            position.pop()
+        return line
+
+    def search_info(self):
+        """ Summary of the last search """
+        return {
+            'move': self.best_move,
+            'score': self.best_score,
+            'depth': self.completed_depth,
+            'pv': self.principal_variation or [self.best_move],
+            'book': self.book_move,
+            'tablebase': self.tablebase_move,
+            'tablebase_hits': self.tablebase_hits,
+            'nodes': self.nodes,
+            'quiescence_nodes': self.quiescence_nodes,
+            'evaluated': self.pos_evaluated_count,
+            'time': self.elapsed_time,
+            'nps': int((self.nodes + self.quiescence_nodes) / self.elapsed_time) if self.elapsed_time else 0,
+            'first_move_cutoff_rate': self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+            'hash': self.transposition_table.stats(),
+        }
+
+    def order_moves(self, position, moves, hash_move, ply):
+        """ Sorts the moves in place so the ones most likely to cause a cutoff are searched first """
+        squares = position.squares
+        en_passant = position.en_passant
+        killer_1, killer_2 = self.killers[ply]
+        history = self.history
+
+        def order(move):
+            if move == hash_move:
+                return HASH_MOVE_ORDER
+            to_square = (move >> 6) & 63
+            piece = squares[move & 63]
+            victim = squares[to_square]
+            if victim is not None:
+                # most valuable victim first, the least valuable attacker breaks ties
+                return CAPTURE_ORDER + (victim % 6) * 8 + (move >> 12) * 8 - piece % 6
+            if move >> 12 == QUEEN:
+                return CAPTURE_ORDER + QUEEN * 8
+            if to_square == en_passant and piece % 6 == PAWN:
+                return CAPTURE_ORDER + PAWN * 8
+            if move == killer_1:
+                return KILLER_ORDER + 1
+            if move == killer_2:
+                return KILLER_ORDER
+            return history[piece * 64 + to_square]
+
+        moves.sort(key=order, reverse=True)
+
+    def update_quiet_cutoff(self, position, move, depth, ply):
+        """ Remembers a quiet move that caused a beta cutoff as killer and in the history table """
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        index = position.squares[move & 63] * 64 + ((move >> 6) & 63)
+        self.history[index] += depth * depth
+        if self.history[index] >= HISTORY_LIMIT:
+            self.history = [value >> 1 for value in self.history]
+
+    def is_quiet(self, position, move):
+        """ Neither a capture nor a promotion """
+        to_square = (move >> 6) & 63
+        if move >> 12 or position.squares[to_square] is not None:
+            return False
+        return not (to_square == position.en_passant and position.squares[move & 63] % 6 == PAWN)
+
+    def tablebase_score(self, position, ply):
+        """ Exact score of a position in the tablebases, None when it is not covered """
+        result = self.tablebase.probe(position)
+        if result is None:
+            return None
+        self.tablebase_hits += 1
+        outcome, distance = result
+        if outcome == WIN:
+            return MATE_SCORE - ply - distance
+        if outcome == LOSS:
+            return -MATE_SCORE + ply + distance
+        return 0
+
+    def choose_tablebase_move(self, position, moves):
+        """ Picks the move with the best exact result without searching, False when the position is not covered """
+        if self.tablebase_score(position, 0) is None:
+            return False
+        best_score = -INFINITY
+        for move in moves:
+            position.push(move)
+            score = self.tablebase_score(position, 1)
+            position.pop()
+            if score is None:
+                return False
+            score = -score
+            if score > best_score:
+                best_score = score
+                self.best_move = move
+                self.best_score = score
+        return True
+
+    def search_root(self, position, moves, depth):
+        """ Searches every root move, a better move found before an abort is kept """
+        alpha = -INFINITY
+        for move in moves:
+            position.push(move)
+            score = -self.negamax(position, depth - 1, -INFINITY, -alpha, 1)
+            position.pop()
+            if score > alpha:
+                alpha = score
+                self.best_move = move
+                self.best_score = score
+        self.transposition_table.store(position.hash, depth, alpha, EXACT, self.best_move)
+
+    def negamax(self, position, depth, alpha, beta, ply):
+        """ Alpha-beta search in negamax form, scores are from the view of the side to move """
+        self.nodes += 1
+        self.check_limits()
+        # a position seen before in the game or the search is scored as a draw
+        if position.half_move >= 100 or position.repetitions[position.hash] > 1:
+            return 0
+        if self.tablebase:
+            score = self.tablebase_score(position, ply)
+            if score is not None:
+                return score
+        if depth == 0:
+            if self.quiescence_node_limit is not None:
+                self.quiescence_budget = self.quiescence_nodes + self.quiescence_node_limit
+            return self.quiescence(position, alpha, beta, ply)
+
+        # reuse the result of an earlier visit of the same position
+        entry = self.transposition_table.probe(position.hash)
+        hash_move = 0
+        if entry:
+            entry_depth, score, bound, hash_move = entry
+            if entry_depth >= depth:
+                score = score_from_table(score, ply)
+                if bound == EXACT or (bound == LOWER_BOUND and score >= beta) or \
+                        (bound == UPPER_BOUND and score <= alpha):
+                    return score
+
+        moves = position.legal_moves()
+        if not moves:
+            # checkmate or stalemate, faster mates score higher
+            return -MATE_SCORE + ply if position.in_check() else 0
+        self.order_moves(position, moves, hash_move, ply)
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = 0
+        for index, move in enumerate(moves):
+            position.push(move)
+            score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            position.pop()
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        self.first_move_cutoffs += index == 0
+                        if self.is_quiet(position, move):
+                            self.update_quiet_cutoff(position, move, depth, ply)
+                        break
+
+        if best_score >= beta:
+            bound = LOWER_BOUND
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER_BOUND
+        self.transposition_table.store(position.hash, depth, score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def quiescence(self, position, alpha, beta, ply):
+        """ Searches captures only until the position is quiet, so no leaf is scored in the middle of an exchange """
+        self.quiescence_nodes += 1
+        self.check_limits()
+        in_check = position.in_check()
+        if in_check:
+            # no standing pat in check, every evasion is searched
+            moves = position.legal_moves()
+            if not moves:
+                return -MATE_SCORE + ply
+            stand_pat = -INFINITY
+        else:
+            # the side to move can usually do at least as well as its static score by not capturing
+            stand_pat = self.evaluate(position)
+            if stand_pat >= beta:
+                return stand_pat
+            if self.quiescence_budget is not None and self.quiescence_nodes >= self.quiescence_budget:
+                return stand_pat  # the capture search of this leaf used up its nodes
+            alpha = max(alpha, stand_pat)
+            moves = position.legal_moves(captures_only=True)
+        self.order_moves(position, moves, 0, min(ply, MAX_PLY - 1))
+
+        best_score = stand_pat
+        squares = position.squares
+        for move in moves:
+            if not in_check:
+                # delta pruning, skip captures that cannot raise alpha even with a margin
+                victim = squares[(move >> 6) & 63]
+                gain = MIDGAME_VALUES[victim % 6] if victim is not None else MIDGAME_VALUES[PAWN]
+                if move >> 12:
+                    gain += MIDGAME_VALUES[move >> 12] - MIDGAME_VALUES[PAWN]
+                if stand_pat + gain + DELTA_MARGIN <= alpha:
+                    continue
+            position.push(move)
+            score = -self.quiescence(position, -beta, -alpha, ply + 1)
+            position.pop()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score
+
+    def close(self):
+        """ Releases the opening book file """
+        if self.book:
+            self.book.close()
+            self.book = None
@@ -0,0 +1,219 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import re
+import sys
+import time
+
+from ai import AI, MATE_BOUND, MATE_SCORE
+from pgn import PGNError, parse_san, move_to_san
+from position import Position, COLOR_NAMES, move_to_uci
+
+# an EPD operation is an opcode followed by operands up to the semicolon, quoted operands may contain semicolons
+OPERATION_PATTERN = re.compile(r'\s*(\w+)\s*((?:"[^"]*"|[^;"])*);')
+
+# the AI of a pool process, created once and used for all of its positions
+_worker_ai = None
+
+
+def parse_epd(line):
+    """ The FEN and the operations of an EPD line, a plain FEN line has no operations.
+    The clocks come from the FEN fields or the hmvc and fmvn operations, None for an empty line """
+    fields = line.split(None, 4)
+    if len(fields) < 4 or line.lstrip().startswith('#'):
+        return None
+    rest = fields[4] if len(fields) > 4 else ''
+    clocks = rest.split(None, 2)
+    if len(clocks) >= 2 and clocks[0].isdigit() and clocks[1].isdigit():
+        rest = clocks[2] if len(clocks) > 2 else ''
+        clocks = clocks[:2]
+    else:
+        clocks = None
+    operations = {opcode: operand.strip() for opcode, operand in OPERATION_PATTERN.findall(rest)}
+    if clocks is None:
+        clocks = [operations.get('hmvc', '0'), operations.get('fmvn', '1')]
+    return ' '.join(fields[:4] + clocks), operations
+
+
+def read_positions(stream):
+    """ Yields (line number, FEN, operations) for every position line, one line at a time """
+    for number, line in enumerate(stream, 1):
+        parsed = parse_epd(line)
+        if parsed:
+            yield (number,) + parsed
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def init_pool_worker(ai_settings):
+    global _worker_ai
+    _worker_ai = AI('white', **ai_settings)
+
+
+def expected_moves(position, operand):
+    """ The moves of a bm or am operand, SAN moves separated by spaces """
+    moves = set()
+    for san in operand.split():
+        try:
+            moves.add(parse_san(position, san))
+        except PGNError:
+            pass
+    return moves
+
+
+def analyse_position(number, fen, operations):
+    """ Searches one position, the result holds the search info with the moves in SAN or the error that made it
+    fail. With bm or am operations it also tells whether the best move was found """
+    ai = _worker_ai
+    result = {'line': number, 'fen': fen, 'operations': operations}
+    try:
+        position = Position(fen)
+    except (ValueError, IndexError, KeyError) as error:
+        result['error'] = f'invalid FEN: {error}'
+        return result
+    ai.color = COLOR_NAMES[position.turn]
+    ai.transposition_table.clear()  # every position is searched as if it was the first, results are reproducible
+    ai.history = [0] * len(ai.history)
+    ai.pos_evaluated_count = 0
+    move = ai.find_best_move(position)
+    if move is None:
+        result['error'] = 'checkmate' if position.in_check() else 'stalemate'
+        return result
+    info = ai.search_info()
+    pv = []
+    for pv_move in info['pv']:
+        pv.append(move_to_san(position, pv_move))
+        position.push(pv_move)
+    result.update(move=move_to_uci(move), san=pv[0], score=info['score'], depth=info['depth'],
+                  nodes=info['nodes'] + info['quiescence_nodes'], time=info['time'], pv=pv)
+    if 'bm' in operations or 'am' in operations:
+        position = Position(fen)
+        solved = True
+        if 'bm' in operations:
+            solved = move in expected_moves(position, operations['bm'])
+        if 'am' in operations:
+            solved = solved and move not in expected_moves(position, operations['am'])
+        result['solved'] = solved
+    return result
+
+
+def analyse_batch(batch):
+    """ A position that makes the search fail gets an error result, the rest of the batch and the run go on """
+    results = []
+    for number, fen, operations in batch:
+        try:
+            results.append(analyse_position(number, fen, operations))
+        except Exception as error:
+            results.append({'line': number, 'fen': fen, 'operations': operations,
+                            'error': f'{type(error).__name__}: {error}'})
+    return results
+
+
+def unordered_results(pool, function, tasks, window):
+    """ Like imap_unordered, but at most window tasks are taken from the iterable ahead of the results.
+    The pool reads its whole iterable at once, which does not fit in memory for millions of lines """
+    finished = queue.Queue()
+    running = 0
+    tasks = iter(tasks)
+    exhausted = False
+    while True:
+        while not exhausted and running < window:
+            task = next(tasks, None)
+            if task is None:
+                exhausted = True
+                break
+            pool.apply_async(function, (task,), callback=finished.put, error_callback=finished.put)
+            running += 1
+        if not running:
+            return
+        result = finished.get()
+        running -= 1
+        if isinstance(result, BaseException):
+            raise result
+        yield result
+
+
+def format_epd(result):
+    """ The position with its input operations and the analysis operations: acd depth, acn nodes, acs seconds,
+    ce centipawns for the side to move, dm moves to mate, pm the predicted move and pv the line """
+    operations = dict(result['operations'])
+    if 'error' in result:
+        operations['c9'] = f'"error: {result["error"]}"'
+    else:
+        score = result['score']
+        operations.update(acd=result['depth'], acn=result['nodes'], acs=f"{result['time']:.2f}", ce=score,
+                          pm=result['san'], pv=' '.join(result['pv']))
+        if score > MATE_BOUND:
+            operations['dm'] = (MATE_SCORE - score + 1) // 2
+        elif score < -MATE_BOUND:
+            operations['dm'] = -((MATE_SCORE + score) // 2)
+    fields = result['fen'].split()[:4]
+    return ' '.join(fields + [f'{opcode} {operand};' for opcode, operand in operations.items()])
+
+
+def analyse(stream, output, ai_settings, workers, batch_size, as_json):
+    """ Analyses the positions of the stream in a process pool and writes every result as soon as it is done.
+    Only a few batches per worker are read ahead, so the memory does not grow with the input """
+    counts = {'positions': 0, 'errors': 0, 'tests': 0, 'solved': 0}
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=init_pool_worker, initargs=(ai_settings,)) as pool:
+        tasks = batches(read_positions(stream), batch_size)
+        for results in unordered_results(pool, analyse_batch, tasks, workers * 4):
+            for result in results:
+                counts['positions'] += 1
+                counts['errors'] += 'error' in result
+                if 'solved' in result:
+                    counts['tests'] += 1
+                    counts['solved'] += result['solved']
+                output.write((json.dumps(result) if as_json else format_epd(result)) + '\n')
+            output.flush()
+    elapsed_time = time.perf_counter() - start_time
+    summary = (f"{counts['positions']} positions in {elapsed_time:.1f} s "
+               f"({counts['positions'] / elapsed_time if elapsed_time else 0:.1f} per second), "
+               f"{counts['errors']} errors")
+    if counts['tests']:
+        summary += f", {counts['solved']} of {counts['tests']} solved"
+    print(summary, file=sys.stderr)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyses the FEN or EPD positions of a file, one per line')
+    parser.add_argument('input', nargs='?', default='-', help='position file, standard input by default')
+    parser.add_argument('-o', '--output', help='result file, standard output by default')
+    parser.add_argument('-d', '--depth', type=int, help='search depth per position')
+    parser.add_argument('-t', '--time', type=float, help='seconds per position')
+    parser.add_argument('-n', '--nodes', type=int, help='search nodes per position')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch', type=int, default=16, help='positions sent to a worker at once')
+    parser.add_argument('--hash', type=int, default=4, help='MB of the transposition table of every worker')
+    parser.add_argument('--tablebases', help='directory of the endgame tables')
+    parser.add_argument('--json', action='store_true', help='write JSON lines instead of EPD')
+    args = parser.parse_args()
+
+    ai_settings = {'depth': args.depth or (64 if args.time or args.nodes else 5), 'time_limit': args.time,
+                   'node_limit': args.nodes, 'hash_size': args.hash, 'tablebase_path': args.tablebases}
+    stream = sys.stdin if args.input == '-' else open(args.input)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        analyse(stream, output, ai_settings, args.workers, args.batch, args.json)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_8 = RANK_1 << 56
+
+SQUARE_BB = [1 << square for square in range(64)]
+
+
+def iter_bits(bitboard):
+    """ Yields the square index of every set bit, lowest first """
+    while bitboard:
+        low_bit = bitboard & -bitboard
+        yield low_bit.bit_length() - 1
+        bitboard ^= low_bit
+
+
+def step_attacks(square, steps):
+    """ Squares reached by single steps, used for the knight, king and pawn tables """
+    file, rank = square % 8, square // 8
+    attacks = 0
+    for step in steps:
+        new_file, new_rank = file + step[0], rank + step[1]
+        if 0 <= new_file < 8 and 0 <= new_rank < 8:
+            attacks |= 1 << (new_rank * 8 + new_file)
+    return attacks
+
+
+def ray_attacks(square, directions, occupied):
+    """ Sliding attacks computed square by square, only used to fill the lookup tables """
+    file, rank = square % 8, square // 8
+    attacks = 0
+    for direction in directions:
+        new_file, new_rank = file + direction[0], rank + direction[1]
+        while 0 <= new_file < 8 and 0 <= new_rank < 8:
+            attacks |= 1 << (new_rank * 8 + new_file)
+            if occupied >> (new_rank * 8 + new_file) & 1:
+                break
+            new_file += direction[0]
+            new_rank += direction[1]
+    return attacks
+
+
+def relevant_mask(square, directions):
+    """ Squares whose occupancy changes the sliding attacks, the board edge never blocks anything """
+    file, rank = square % 8, square // 8
+    mask = 0
+    for direction in directions:
+        new_file, new_rank = file + direction[0], rank + direction[1]
+        while 0 <= new_file + direction[0] < 8 and 0 <= new_rank + direction[1] < 8:
+            mask |= 1 << (new_rank * 8 + new_file)
+            new_file += direction[0]
+            new_rank += direction[1]
+    return mask
+
+
+def build_sliding_table(square, directions, mask):
+    """ Maps every blocker subset of the mask to the attacked squares, the dict plays the role of a magic hash """
+    table = {}
+    subset = 0
+    while True:
+        table[subset] = ray_attacks(square, directions, subset)
+        # carry-rippler trick to walk through all subsets of the mask
+        subset = (subset - mask) & mask
+        if not subset:
+            return table
+
+
+KNIGHT_STEPS = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (-1, 2), (1, -2), (-1, -2)]
+KING_STEPS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, 1), (-1, 1), (1, -1)]
+ROOK_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+BISHOP_DIRECTIONS = [(-1, -1), (1, 1), (-1, 1), (1, -1)]
+
+KNIGHT_ATTACKS = [step_attacks(square, KNIGHT_STEPS) for square in range(64)]
+KING_ATTACKS = [step_attacks(square, KING_STEPS) for square in range(64)]
+# squares attacked by a pawn of the given color standing on the square
+PAWN_ATTACKS = [[step_attacks(square, [(-1, 1), (1, 1)]) for square in range(64)],
+                [step_attacks(square, [(-1, -1), (1, -1)]) for square in range(64)]]
+
+ROOK_MASKS = [relevant_mask(square, ROOK_DIRECTIONS) for square in range(64)]
+BISHOP_MASKS = [relevant_mask(square, BISHOP_DIRECTIONS) for square in range(64)]
+ROOK_TABLES = [build_sliding_table(square, ROOK_DIRECTIONS, ROOK_MASKS[square]) for square in range(64)]
+BISHOP_TABLES = [build_sliding_table(square, BISHOP_DIRECTIONS, BISHOP_MASKS[square]) for square in range(64)]
+
+
+def rook_attacks(square, occupied):
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]]
+
+
+def bishop_attacks(square, occupied):
+    return BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+
+def queen_attacks(square, occupied):
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]] | BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+
+def build_line_tables():
+    """ Squares strictly between two aligned squares and the full line through them, empty when not aligned """
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for directions in (ROOK_DIRECTIONS, BISHOP_DIRECTIONS):
+        for first in range(64):
+            empty_attacks = ray_attacks(first, directions, 0)
+            for second in iter_bits(empty_attacks):
+                between[first][second] = (ray_attacks(first, directions, SQUARE_BB[second]) &
+                                          ray_attacks(second, directions, SQUARE_BB[first]))
+                line[first][second] = ((empty_attacks & ray_attacks(second, directions, 0)) |
+                                       SQUARE_BB[first] | SQUARE_BB[second])
+    return between, line
+
+
+BETWEEN, LINE = build_line_tables()
@@ -2,284 +2,202 @@ import pygame
 
 from settings import *
 from pieces import Piece
-from support import is_king_in_check
+from position import Position, WHITE, PAWN, ROOK, QUEEN, PIECE_NAMES, PIECE_TYPES, encode_move, move_from, move_to
+from tablebase import Tablebase, DRAW
 
 
 class Board:
     def __init__(self, images, player_color, starting_pos):
         self.display_surface = pygame.display.get_surface()
-        self.square = [None] * 64
+        self.square = [None] * 64  # piece sprite of every position square, a1 is 0 like in the position
         self.images = images
 
+        # the tiles never change, they are drawn once and blitted from then on
+        self.background = self.render_background()
+        self.dirty_rects = []  # screen areas changed by moves since the last frame
+
         # groups
         self.all_pieces = pygame.sprite.Group()
         self.white_pieces = pygame.sprite.Group()
         self.black_pieces = pygame.sprite.Group()
 
-        # essential
-        self.player_color = player_color
-        self.white_to_move = True
+        # essential, the position is always stored from white's side, only drawing and input are flipped
+        self.flipped = player_color == 'black'
+        self.position = None
 
-        # special rules and fen variables
+        # pawn promotion waiting for the player's choice
         self.pawn_promotion = None
-        self.en_passant_target = None
-        self.half_move = 0
-        self.full_move = 0
-        self.K_castle = True
-        self.Q_castle = True
-        self.k_castle = True
-        self.q_castle = True
+        self.promotion_squares = None
 
         # game over
         self.checkmate = False
         self.game_drawn = False
+        self.draw_reason = None
+        self.tablebase = Tablebase(TABLEBASE_PATH)  # ends the game once the endgame is a known draw
 
-        # fen
-        self.fen_history = []
+        # (hash, flipped, {from square: [(col, row) targets]}) of the position, built once per ply
+        self.move_map = None
 
         # create Pieces
         self.load_and_create_pieces_from_fen(starting_pos)
 
-    def load_and_create_pieces_from_fen(self, fen):
-        """ Converts a FEN string into a list representing piece positions on the board and initializes the pieces """
-        piece_type_from_symbol = {
-            'k': 'king',
-            'p': 'pawn',
-            'n': 'knight',
-            'b': 'bishop',
-            'r': 'rook',
-            'q': 'queen'
-        }
-
-        fen_board = fen.split(' ')[0]
-        file = 0
-        rank = 7
-        squares = [None] * 64
-
-        # Load positions from the FEN string
-        for symbol in fen_board:
-            if symbol == '/':
-                file = 0
-                rank -= 1
-            elif symbol.isdigit():
-                file += int(symbol)
-            else:
-                piece_colour = 'white' if symbol.isupper() else 'black'
-                piece_type = piece_type_from_symbol[symbol.lower()]
-                piece_name = f'{piece_colour}_{piece_type}'
-                squares[rank * 8 + file] = piece_name
-                file += 1
-
-        # Create pieces on the board from the loaded positions
-        for index, piece in enumerate(squares):
-            pos = (index % 8, index // 8)
-            if piece:
-                self.square[index] = (Piece(piece, self.images[piece],
-                                            (self.all_pieces,
-                                             self.white_pieces if piece.split('_')[
-                                                                      0] == 'white' else self.black_pieces),
-                                            pos,
-                                            self.white_pieces if piece.split('_')[0] == 'white' else self.black_pieces,
-                                            self.black_pieces if piece.split('_')[0] == 'white' else self.white_pieces))
-
-        self.fen_history.append(fen)
+    @property
+    def white_to_move(self):
+        return self.position.turn == WHITE
 
-    def generate_fen_from_board(self):
-        """ Generate a FEN string based on the current board state """
-        fen = ""
-        empty_count = 0
+    def to_screen(self, square):
+        """ Converts a position square into the (col, row) it is drawn at, white is at the bottom unless flipped """
+        if not self.flipped:
+            return square % 8, 7 - square // 8
+        return 7 - square % 8, square // 8
 
-        # Board status
-        for row in range(DIMENSION):
-            for col in range(DIMENSION):
-                piece = self.square[row * 8 + col]
+    def to_square(self, col, row):
+        """ Converts a (col, row) on the screen into the position square """
+        if not self.flipped:
+            return (7 - row) * 8 + col
+        return row * 8 + 7 - col
 
-                if piece is None:
-                    empty_count += 1  # count empty squares
-                else:
-                    if empty_count > 0:
-                        fen += str(empty_count)  # add empty squares count to FEN
-                        empty_count = 0
+    def flip(self):
+        """ Turns the board around, only the view changes, the position and its caches stay the same """
+        self.flipped = not self.flipped
+        self.create_pieces()
 
-                    piece_type = piece.type[0]  # first letter of the piece type (r, n, b, q, k, p)
-                    if 'white' in piece.type:
-                        fen += piece_type.upper()  # uppercase for white pieces
-                    else:
-                        fen += piece_type.lower()  # lowercase for black pieces
+    def square_rect(self, square):
+        col, row = self.to_screen(square)
+        return pygame.Rect(col * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
 
-            if empty_count > 0:
-                fen += str(empty_count)  # append remaining empty squares count
-                empty_count = 0
+    def piece_square(self, piece):
+        return self.to_square(piece.pos[0] // TILE_SIZE, piece.pos[1] // TILE_SIZE)
 
-            if row != DIMENSION - 1:
-                fen += "/"  # add row separator
-
-        # turn
-        turn = 'w' if self.white_to_move else 'b'
-        fen += f" {turn}"
-        # castling
-        castling = ''
-        if any([self.K_castle, self.Q_castle, self.k_castle, self.q_castle]):
-            if self.K_castle:
-                castling += 'K'
-            if self.Q_castle:
-                castling += 'Q'
-            if self.k_castle:
-                castling += 'k'
-            if self.q_castle:
-                castling += 'q'
-        else:
-            castling = '-'
-        fen += f" {castling}"
-        # en passant
-        if self.en_passant_target:
-            file, rank = self.en_passant_target
-            file = CHESS_NOTATION_WHITE[file] if self.player_color == 'white' else CHESS_NOTATION_BLACK[file]
-            rank = 8 - rank if self.player_color == 'white' else rank + 1
-            en_passant = f"{file}{rank}"
-        else:  # No pawn eligible for en-passant
-            en_passant = "-"
-        fen += f" {en_passant}"
-        # halfmove clock
-        fen += f" {self.half_move}"
-        # fullmove number
-        fen += f" {self.full_move}"
-
-        return fen
+    def load_and_create_pieces_from_fen(self, fen):
+        """ Loads the position from a FEN string and initializes the pieces """
+        self.position = Position(fen)
+        self.create_pieces()
+
+    def create_pieces(self):
+        """ Creates the piece sprites for the current position """
+        for piece in self.all_pieces:
+            piece.kill()
+        self.square = [None] * 64
 
-    def generate_current_sides_moves(self):
-        legal_moves = {}
-        for piece in self.white_pieces if self.white_to_move else self.black_pieces:
-            piece_legal_moves = piece.generate_legal_moves(
-                self.square, 'black' if self.white_to_move else 'white', en_passant_target=self.en_passant_target)
-            if piece_legal_moves:
-                legal_moves[piece] = piece_legal_moves
-        return legal_moves
+        for index, piece in enumerate(self.position.squares):
+            if piece is not None:
+                name = PIECE_NAMES[piece]
+                self.square[index] = Piece(name, self.images[name],
+                                           (self.all_pieces, self.white_pieces if piece < 6 else self.black_pieces),
+                                           self.to_screen(index))
+
+    def legal_move_map(self):
+        """ The (col, row) targets of every square's piece, promotions to different pieces share one target.
+        It is built from the position's cached moves and only again after a move, an undo or a flip """
+        if self.move_map is None or self.move_map[:2] != (self.position.hash, self.flipped):
+            targets = {}
+            for move in self.position.cached_legal_moves():
+                square_targets = targets.setdefault(move_from(move), [])
+                target = self.to_screen(move_to(move))
+                if target not in square_targets:
+                    square_targets.append(target)
+            self.move_map = (self.position.hash, self.flipped, targets)
+        return self.move_map[2]
+
+    def generate_legal_moves(self, piece):
+        """ Returns the (col, row) targets of a piece """
+        return self.legal_move_map().get(self.piece_square(piece), [])
 
     def make_move(self, piece, new_col, new_row, legal_moves):
         """ Handles the move logic for a piece """
         if (new_col, new_row) in legal_moves:
-            old_col = piece.pos[0] // TILE_SIZE
-            old_row = piece.pos[1] // TILE_SIZE
-            target_piece = self.square[new_row * 8 + new_col]
-            old_position = (old_col, old_row)
-
-            # If valid, finalize the move
-            piece.pos = (new_col * TILE_SIZE, new_row * TILE_SIZE)
-            piece.pos = piece.pos
-            piece.rect.topleft = piece.pos
-            self.square[old_position[1] * 8 + old_position[0]] = None  # Clear old position
-            self.square[new_row * 8 + new_col] = piece  # Update to new position
-            if not piece.has_moved:
-                piece.has_moved = True
-
-            # Castling
-            if piece.type == 'king':
-                if abs(new_col - old_col) == 2:  # Tries to castle
-                    self.handle_castling(new_col, old_col, old_row)
-
-            # Pawn en-passant or promotion
-            if piece.type == 'pawn':
-                if new_row == 0 or new_row == 7:
-                    self.pawn_promotion = piece
-                if self.en_passant_target and (new_col, new_row) == self.en_passant_target:  # If en-passant
-                    target_col = self.en_passant_target[0]  # Column of the en passant target
-                    target_row = new_row + (old_row - new_row)  # The row where the captured pawn resides
-                    target_pos = target_row * 8 + target_col  # Convert (col, row) to board position index
-                    target_piece = self.square[target_pos]  # The captured pawn
-                    self.square[target_pos] = None  # Clear captured pawn position
-                    self.en_passant_target = None
-                if abs(new_row - old_row) == 2:  # Check if pawn moved two squares forward
-                    target_row = (old_row + new_row) // 2  # The row between the start and end position
-                    self.en_passant_target = (new_col, target_row)  # Set en passant target position
-                else:
-                    self.en_passant_target = None
+            from_square = self.piece_square(piece)
+            to_square = self.to_square(new_col, new_row)
+
+            if self.position.squares[from_square] % 6 == PAWN and to_square // 8 in (0, 7):
+                # Keep the pawn on the last rank until the player picked the promotion piece
+                piece.pos = (new_col * TILE_SIZE, new_row * TILE_SIZE)
+                piece.rect.topleft = piece.pos
+                target_piece = self.square[to_square]
+                if target_piece:
+                    target_piece.kill()
+                self.pawn_promotion = piece
+                self.promotion_squares = (from_square, to_square)
+                self.dirty_rects += [self.square_rect(from_square), self.square_rect(to_square)]
             else:
-                self.en_passant_target = None  # Reset if no en passant is possible
-
-            # Capturing
-            if target_piece:
-                if target_piece.color != piece.color:
-                    target_piece.kill()  # Handle captured piece
-
-            self.white_to_move = not self.white_to_move
-
-            # Change counting variables
-            if piece.type == 'pawn' or target_piece:
-                self.half_move = 0
-            else:
-                self.half_move += 1
-            if piece.color == 'white':
-                self.full_move += 1
+                self.apply_move(encode_move(from_square, to_square))
 
             return True  # Move successfully made
         else:
             return False
 
-    def handle_castling(self, new_col, old_col, old_row):
-        """ Handles the rook placement of the castling logic """
-        # Determine right castling
-        if new_col - old_col == 2:
-            rook_col = 7  # Always column 7
-            rook_target_col = old_col + 1  # Rook moves to the column next to the king
-        # Determine left castling
-        elif new_col - old_col == -2:
-            rook_col = 0  # Always column 0
-            rook_target_col = old_col - 1  # Rook moves to the column next to the king
+    def apply_move(self, move):
+        """ Plays a move on the position and rebuilds the sprites """
+        old_squares = self.position.squares[:]
+        self.position.push(move)
+        self.mark_changed_squares(old_squares)
+        self.create_pieces()
+
+    def mark_changed_squares(self, old_squares):
+        """ Remembers the squares whose piece changed so that only they are redrawn """
+        for square, piece in enumerate(self.position.squares):
+            if piece != old_squares[square]:
+                self.dirty_rects.append(self.square_rect(square))
+
+    def undo_move(self):
+        """ Takes back the last move, a promotion still waiting for its piece is cancelled instead """
+        if self.pawn_promotion:
+            self.dirty_rects += [self.square_rect(square) for square in self.promotion_squares]
+            self.pawn_promotion = None
+            self.promotion_squares = None
+        elif self.position.move_stack:
+            old_squares = self.position.squares[:]
+            self.position.pop()
+            self.mark_changed_squares(old_squares)
         else:
-            return
-        # Move the rook if it exists and is a rook
-        rook = self.square[old_row * 8 + rook_col]
-        if rook and rook.type == 'rook':
-            # Move the rook to the target position next to the king
-            rook.pos = (rook_target_col * TILE_SIZE, old_row * TILE_SIZE)
-            rook.rect.topleft = rook.pos
-            self.square[old_row * 8 + rook_col] = None  # Clear old rook position
-            self.square[old_row * 8 + rook_target_col] = rook  # Place rook in the new position
+            return False
+        self.checkmate = False
+        self.game_drawn = False
+        self.draw_reason = None
+        self.create_pieces()
+        return True
 
     def promote_pawn(self, promotion_type):
-        """ Handles the replacement of the promoting pawn with the new piece """
-        # Get the variables of the pawn
-        col, row = self.pawn_promotion.pos[0] // TILE_SIZE, self.pawn_promotion.pos[1] // TILE_SIZE
-        pos = (col, row)
-        name = f"{self.pawn_promotion.color}_{promotion_type}"
-        surf = self.images[name]
-
-        # Replace the pawn with the selected piece
-        if self.pawn_promotion.color == 'white':
-            new_piece = Piece(name, surf, (self.all_pieces, self.white_pieces), pos,
-                              self.white_pieces, self.black_pieces)
-            self.white_pieces.add(new_piece)
-        else:
-            new_piece = Piece(name, surf, (self.all_pieces, self.black_pieces), pos,
-                              self.black_pieces, self.white_pieces)
-            self.black_pieces.add(new_piece)
-
-        # Update the board
-        self.square[row * 8 + col] = new_piece
-        self.all_pieces.add(new_piece)
-
-        # Clear the pawn promotion flag and the piece
-        self.pawn_promotion.kill()
+        """ Plays the waiting promotion move with the selected piece """
+        from_square, to_square = self.promotion_squares
         self.pawn_promotion = None
+        self.promotion_squares = None
+        self.apply_move(encode_move(from_square, to_square, PIECE_TYPES.index(promotion_type)))
 
     def check_game_over(self):
-        if not self.generate_current_sides_moves():
-            if is_king_in_check(
-                    self.square,
-                    self.black_pieces if self.white_to_move else self.white_pieces,
-                    self.white_pieces if self.white_to_move else self.black_pieces,
-                    'white' if self.white_to_move else 'black'):
+        if not self.legal_move_map():
+            if self.position.in_check():
                 self.checkmate = True
             else:
                 self.game_drawn = True
+                self.draw_reason = 'stalemate'
+        elif self.position.is_repetition():
+            self.game_drawn = True
+            self.draw_reason = 'repetition'
+        elif self.position.is_fifty_moves():
+            self.game_drawn = True
+            self.draw_reason = 'fifty-move rule'
+        elif self.tablebase.probe(self.position) == (DRAW, 0):
+            self.game_drawn = True
+            pieces = self.position.pieces
+            if any(pieces[color * 6 + piece_type] for color in (0, 1) for piece_type in (PAWN, ROOK, QUEEN)):
+                self.draw_reason = 'tablebase'
+            else:
+                self.draw_reason = 'insufficient material'
 
-    def draw_board(self):
-        """ Draw the rectangles of the board """
+    def render_background(self):
+        """ Draw the rectangles of the board onto a surface that is kept for the whole game """
+        surface = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
         for col in range(DIMENSION):
             for row in range(DIMENSION):
                 color = COLORS['board_light'] if (col + row) % 2 == 0 else COLORS['board_dark']
                 x = TILE_SIZE * row
                 y = TILE_SIZE * col
                 rect = pygame.rect.FRect(x, y, TILE_SIZE, TILE_SIZE)
-                pygame.draw.rect(self.display_surface, color, rect)
+                pygame.draw.rect(surface, color, rect)
+        return surface
+
+    def draw_board(self):
+        """ Draw the cached board, drawing is clipped to the area that is being redrawn """
+        self.display_surface.blit(self.background, (0, 0))
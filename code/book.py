@@ -0,0 +1,144 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+
+from position import Position, move_to_uci
+from pgn import PGNError, game_positions, map_games
+
+# every entry is a big-endian 64-bit position hash, 16-bit move, 16-bit weight and 32 unused bits,
+# sorted by hash, the Polyglot layout with the hash and move encoding of this program
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+
+RESULT_POINTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}  # points for white and black
+
+
+class OpeningBook:
+    """ Read-only view of a book file, it is memory-mapped so only the probed pages are loaded """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.count = size // ENTRY.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def find_first(self, key):
+        """ Binary search for the first entry with the key, or the one where it would be """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, key):
+        """ (move, weight) of every book move stored for the position hash """
+        result = []
+        index = self.find_first(key)
+        while index < self.count:
+            entry_key, move, weight, _ = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            result.append((move, weight))
+            index += 1
+        return result
+
+    def moves(self, position):
+        """ The legal book moves of the position with their weights """
+        legal_moves = position.legal_moves()
+        return [(move, weight) for move, weight in self.entries(position.hash) if move in legal_moves]
+
+    def choose_move(self, position, rng=random):
+        """ Picks a book move at random by weight, None when the position is not in the book """
+        moves = [(move, weight) for move, weight in self.moves(position) if weight]
+        if not moves:
+            return None
+        return rng.choices([move for move, _ in moves], [weight for _, weight in moves])[0]
+
+
+def count_book_moves(games, max_ply):
+    """ Counts and weights of the (position hash, move) pairs of the first plies of the games """
+    counts = {}
+    weights = {}
+    played = skipped = 0
+    for tags, movetext in games:
+        points = RESULT_POINTS.get(tags.get('Result'))
+        if points is None:
+            continue
+        try:
+            for ply, (position, move) in enumerate(game_positions(tags, movetext)):
+                if ply >= max_ply:
+                    break
+                entry = (position.hash, move)
+                counts[entry] = counts.get(entry, 0) + 1
+                weights[entry] = weights.get(entry, 0) + points[position.turn]
+        except PGNError:
+            skipped += 1
+            continue
+        played += 1
+    return counts, weights, played, skipped
+
+
+def build_book(pgn_paths, output_path, max_ply=20, min_games=1, workers=None):
+    """ Collects the opening moves of PGN games and writes them as a sorted book file.
+    A move scores two points for every win and one for every draw of the side that played it.
+    The files are split into parts that are counted in a process pool """
+    counts = {}
+    weights = {}
+    games = skipped = 0
+    for part_counts, part_weights, part_games, part_skipped in map_games(pgn_paths, count_book_moves, workers,
+                                                                          (max_ply,)):
+        for entry, count in part_counts.items():
+            counts[entry] = counts.get(entry, 0) + count
+            weights[entry] = weights.get(entry, 0) + part_weights[entry]
+        games += part_games
+        skipped += part_skipped
+
+    # weights are scaled down to 16 bits if the most played move does not fit
+    entries = sorted(entry for entry, count in counts.items() if count >= min_games)
+    scale = max(1, -(-max((weights[entry] for entry in entries), default=0) // 0xFFFF))
+    with open(output_path, 'wb') as output:
+        for key, move in entries:
+            weight = weights[(key, move)]
+            output.write(ENTRY.pack(key, move, -(-weight // scale) if weight else 0, 0))
+    return games, skipped, len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds or probes an opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='build a book from PGN files')
+    build_parser.add_argument('output')
+    build_parser.add_argument('pgn', nargs='+')
+    build_parser.add_argument('--max-ply', type=int, default=20, help='moves per game that go into the book')
+    build_parser.add_argument('--min-games', type=int, default=1,
+                              help='drop moves played in fewer games than this')
+    build_parser.add_argument('-w', '--workers', type=int, help='processes reading the files, all cores by default')
+    probe_parser = commands.add_parser('probe', help='list the book moves of a position')
+    probe_parser.add_argument('book')
+    probe_parser.add_argument('fen', nargs='?')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        games, skipped, entries = build_book(args.pgn, args.output, args.max_ply, args.min_games, args.workers)
+        print(f'{entries} entries from {games} games written to {args.output}, {skipped} games skipped')
+    else:
+        book = OpeningBook(args.book)
+        position = Position(args.fen) if args.fen else Position()
+        for move, weight in sorted(book.moves(position), key=lambda entry: -entry[1]):
+            print(f'{move_to_uci(move)} {weight}')
+        book.close()
+
+
+if __name__ == '__main__':
+    main()
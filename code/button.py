@@ -7,20 +7,32 @@ class Button:
         self.text = text
         self.font = font
 
-    def draw(self, surface):
-        """ Draw the button with hover effect """
-        mouse_pos = pygame.mouse.get_pos()
-        is_hovered = self.rect.collidepoint(mouse_pos)
-        color = COLORS['button_hover'] if is_hovered else COLORS['button']
-
-        # Draw the button background (with rounded corners if you like)
-        pygame.draw.rect(surface, color, self.rect, border_radius=8)
+        # pre-rendered normal and hover surfaces, rendered again only when the text or font changes
+        self.surfaces = None
+        self.rendered_for = None
 
-        # Render the text
+    def render(self):
+        """ Renders the button once for its normal and hover state """
         text_surface = self.font.render(self.text, True, COLORS['text'])
-        text_x = self.rect.x + (self.rect.width - text_surface.get_width()) // 2
-        text_y = self.rect.y + (self.rect.height - text_surface.get_height()) // 2
-        surface.blit(text_surface, (text_x, text_y))
+        text_x = (self.rect.width - text_surface.get_width()) // 2
+        text_y = (self.rect.height - text_surface.get_height()) // 2
+        self.surfaces = {}
+        for is_hovered in (False, True):
+            # transparent surface, so the rounded corners show what is underneath
+            surf = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+            color = COLORS['button_hover'] if is_hovered else COLORS['button']
+            pygame.draw.rect(surf, color, surf.get_rect(), border_radius=8)
+            surf.blit(text_surface, (text_x, text_y))
+            self.surfaces[is_hovered] = surf
+        self.rendered_for = (self.text, self.font, self.rect.size)
+
+    def draw(self, surface, mouse_pos=None):
+        """ Draw the button with hover effect """
+        if self.rendered_for != (self.text, self.font, self.rect.size):
+            self.render()
+        if mouse_pos is None:
+            mouse_pos = pygame.mouse.get_pos()
+        surface.blit(self.surfaces[self.rect.collidepoint(mouse_pos)], self.rect)
 
     def is_clicked(self, event):
         """ Check if the button is clicked """
@@ -1,11 +1,12 @@
 import pygame
 from settings import *
-from support import load_images, load_position_from_fen
+from support import load_images
 from board import Board
-from pieces import Piece
+from position import START_FEN
 from button import Button
 from text import draw_text_box
-from ai import AI
+from worker import SearchWorker
+from profiler import PROFILER, format_report
 
 
 class Engine:
@@ -13,17 +14,27 @@ class Engine:
         # pygame setup
         self.running = True
         self.display_surface = pygame.display.get_surface()
+        self.clock = pygame.time.Clock()
+
+        # rendering, only the areas that changed since the last frame are redrawn
+        self.dirty_rects = []
+        self.full_redraw = True
+        self.overlay_state = None
 
         # general setup
         self.player_color = player_color
         self.selected_piece = None
         self.setup()
 
-        # ai
+        # ai, searching in a worker process while the window keeps running
         self.vs_ai = vs_ai
+        self.ai_worker = None
         if self.vs_ai:
-            self.ai = AI('black' if self.player_color == 'white' else 'white', self)
-        self.ai_turn = False if self.player_color == 'white' else True
+            self.ai_worker = SearchWorker('black' if self.player_color == 'white' else 'white',
+                                          depth=AI_MAX_DEPTH, time_limit=AI_TIME_LIMIT, node_limit=AI_NODE_LIMIT,
+                                          hash_size=AI_HASH_SIZE, quiescence_node_limit=AI_QUIESCENCE_NODE_LIMIT,
+                                          book_path=AI_BOOK_PATH, tablebase_path=TABLEBASE_PATH, workers=AI_WORKERS)
+        self.ai_turn = self.vs_ai and self.player_color == 'black'
 
         # moves
         self.legal_moves = None
@@ -31,6 +42,12 @@ class Engine:
         # Fonts
         self.font_promotion = pygame.font.SysFont('Arial', 20)
         self.font_text = pygame.font.SysFont('Arial', 50)
+        self.font_hud = pygame.font.SysFont('Arial', 16)
+
+        # profiling, the display in the top left corner is shown while it is on
+        self.hud_rect = None
+        if PROFILE:
+            PROFILER.enable()
 
         # Define scaling factors based on window height
         button_width = int(WINDOW_WIDTH * 0.2)  # Each button takes
@@ -50,14 +67,15 @@ class Engine:
         }
         self.exit_button = Button(WINDOW_WIDTH // 2 - button_width // 2, WINDOW_HEIGHT // 2 - button_height // 2,
                                   button_width, button_height, f"Exit", self.font_promotion)
+        self.undo_button = Button(WINDOW_WIDTH // 2 - button_width // 2, WINDOW_HEIGHT // 2 + button_height,
+                                  button_width, button_height, "Undo", self.font_promotion)
 
     def setup(self):
         """ Loads images and initializes the board and pieces from the starting FEN """
         self.images = load_images('..', 'graphics', 'pieces')
 
         # create the board
-        self.board = Board(self.images, self.player_color,
-                           START_FEN_WHITE if self.player_color == 'white' else START_FEN_BLACK)
+        self.board = Board(self.images, self.player_color, START_FEN)
 
     def draw(self):
         """ Renders the game board, highlights, and pieces on the display surface """
@@ -72,9 +90,57 @@ class Engine:
                 text = "White wins!" if not self.board.white_to_move else "Black wins!"
                 draw_text_box(self.display_surface, text, (WINDOW_WIDTH//2, WINDOW_HEIGHT//3), self.font_text)
             elif self.board.game_drawn:
-                text = "Draw!"
+                text = f"Draw by {self.board.draw_reason}!"
                 draw_text_box(self.display_surface, text, (WINDOW_WIDTH // 2, WINDOW_HEIGHT // 3), self.font_text)
             self.exit_button.draw(self.display_surface)
+            self.undo_button.draw(self.display_surface)
+        elif self.ai_worker and self.ai_worker.thinking:
+            draw_text_box(self.display_surface, "AI is thinking...", (WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2),
+                          self.font_promotion)
+
+    def highlight_rects(self):
+        """ Areas of the selected piece's square and its legal moves """
+        if not self.selected_piece:
+            return []
+        rects = [pygame.Rect(self.selected_piece.pos, (TILE_SIZE, TILE_SIZE))]
+        rects += [pygame.Rect(move[0] * TILE_SIZE, move[1] * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                  for move in self.legal_moves]
+        return rects
+
+    def visible_buttons(self):
+        if self.board.pawn_promotion:
+            return list(self.promotion_buttons.values())
+        if self.board.checkmate or self.board.game_drawn:
+            return [self.exit_button, self.undo_button]
+        return []
+
+    def render(self):
+        """ Redraws the changed areas, or everything when an overlay appeared or disappeared """
+        overlay_state = (bool(self.board.pawn_promotion), self.board.checkmate or self.board.game_drawn,
+                         bool(self.ai_worker and self.ai_worker.thinking))
+        if overlay_state != self.overlay_state:
+            self.overlay_state = overlay_state
+            self.full_redraw = True
+        self.dirty_rects += self.board.dirty_rects
+        self.board.dirty_rects.clear()
+        if self.hud_rect:
+            self.dirty_rects.append(self.hud_rect)  # the board under the last HUD is drawn again
+            self.hud_rect = None
+
+        if self.full_redraw:
+            self.draw()
+            self.draw_hud()
+            pygame.display.flip()
+        elif self.dirty_rects or PROFILER.enabled:
+            if self.dirty_rects:
+                # the scene is drawn once, clipped to the area around all changes, and only the changes are sent
+                self.display_surface.set_clip(self.dirty_rects[0].unionall(self.dirty_rects[1:]))
+                self.draw()
+                self.display_surface.set_clip(None)
+            self.draw_hud()
+            pygame.display.update(self.dirty_rects)
+        self.full_redraw = False
+        self.dirty_rects = []
 
     def draw_highlights(self):
         """ Highlights the selected piece and its legal moves on the board """
@@ -101,9 +167,10 @@ class Engine:
                     if piece.rect.collidepoint(pos):
                         if (self.board.white_to_move and 'white' in piece.color) or (
                                 not self.board.white_to_move and 'black' in piece.color):
+                            self.dirty_rects += self.highlight_rects()
                             self.selected_piece = piece  # Select the piece
-                            self.legal_moves = self.selected_piece.generate_legal_moves(
-                                self.board.square, self.player_color, en_passant_target=self.board.en_passant_target)
+                            self.legal_moves = self.board.generate_legal_moves(self.selected_piece)
+                            self.dirty_rects += self.highlight_rects()
                         break
             else:
                 # Handle promotion selection
@@ -111,18 +178,35 @@ class Engine:
                     if button.rect.collidepoint(pos):
                         self.board.promote_pawn(promotion_type)
 
-                        # Generate new FEN and add to history
-                        new_fen = self.board.generate_fen_from_board()
-                        self.board.fen_history.append(new_fen)
-
                         if self.vs_ai:
                             self.ai_turn = not self.ai_turn
                         if not self.board.checkmate and not self.board.game_drawn:
                             self.board.check_game_over()
                         break
-        else:
+        elif self.board.checkmate or self.board.game_drawn:
+            # the buttons are only on screen once the game is over, during the AI's turn clicks are ignored
             if self.exit_button.rect.collidepoint(pos):
                 self.running = False
+            elif self.undo_button.rect.collidepoint(pos):
+                self.undo_move()
+
+    def undo_move(self):
+        """ Takes back the last move, against the AI its reply is taken back as well """
+        self.dirty_rects += self.highlight_rects()
+        self.selected_piece = None
+        self.legal_moves = None
+        if self.board.pawn_promotion:
+            self.board.undo_move()  # only cancels the promotion
+            return
+        if self.vs_ai and self.ai_turn:
+            # the AI has not replied yet, only the player's move is taken back
+            self.ai_worker.cancel()
+            self.board.undo_move()
+        else:
+            for _ in range(2 if self.vs_ai else 1):
+                self.board.undo_move()
+        if self.vs_ai:
+            self.ai_turn = self.board.white_to_move != (self.player_color == 'white')
 
     def handle_mouse_move(self, pos):
         """ Updates the position of the selected piece based on mouse movement """
@@ -135,8 +219,10 @@ class Engine:
                 x = max(-TILE_SIZE//2, min(x, WINDOW_WIDTH - TILE_SIZE//2))
                 y = max(-TILE_SIZE//2, min(y, WINDOW_HEIGHT - TILE_SIZE//2))
 
-                # update the piece's position
+                # update the piece's position, both the old and the new area have to be redrawn
+                self.dirty_rects.append(self.selected_piece.rect.copy())
                 self.selected_piece.rect.topleft = (x, y)
+                self.dirty_rects.append(self.selected_piece.rect.copy())
 
     def handle_mouse_release(self, pos):
         """ Executes the move of the selected piece and updates the game state """
@@ -144,13 +230,12 @@ class Engine:
             if self.selected_piece:
                 col = pos[0] // TILE_SIZE
                 row = pos[1] // TILE_SIZE
+                self.dirty_rects += self.highlight_rects() + [self.selected_piece.rect.copy()]
 
                 # Call the Board's make_move method
                 if self.board.make_move(self.selected_piece, col, row, self.legal_moves):
                     # If the move is successful, handle any additional logic
                     if not self.board.pawn_promotion:
-                        new_fen = self.board.generate_fen_from_board()
-                        self.board.fen_history.append(new_fen)
                         if self.vs_ai:
                             self.ai_turn = not self.ai_turn
                         if not self.board.checkmate and not self.board.game_drawn:
@@ -162,24 +247,80 @@ class Engine:
                 self.selected_piece = None  # Deselect the piece
                 self.legal_moves = None
 
+    def update_ai(self):
+        """ Starts the AI search on its turn and plays its move once the worker is done """
+        if self.ai_turn and not self.board.game_drawn and not self.board.checkmate and not self.ai_worker.thinking:
+            self.ai_worker.start(self.board.position, PROFILER.enabled)
+        info = self.ai_worker.poll()
+        if info:
+            if info['move'] is not None:
+                self.board.apply_move(info['move'])
+            self.ai_turn = False
+            if not self.board.checkmate and not self.board.game_drawn:
+                self.board.check_game_over()
+
+    def flip_board(self):
+        """ Turns the board around, not while a promotion waits for its piece as the pawn is only drawn there """
+        if self.board.pawn_promotion:
+            return
+        self.selected_piece = None  # the selection and its targets are screen positions
+        self.legal_moves = None
+        self.board.flip()
+        self.full_redraw = True
+
+    def toggle_profiling(self):
+        """ Switches the profiling on or off, the report of the profiled time is printed when it is switched off """
+        if PROFILER.toggle():
+            PROFILER.reset()
+        else:
+            self.print_profile()
+        self.full_redraw = True  # removes the display
+
+    def print_profile(self):
+        print(PROFILER.report())
+        if self.ai_worker and self.ai_worker.last_info and 'profile' in self.ai_worker.last_info:
+            print('search worker')
+            print(format_report(self.ai_worker.last_info['profile']))
+
+    def draw_hud(self):
+        """ Frame time and the speed of the last AI search, drawn over the board every frame while profiling """
+        if not PROFILER.enabled:
+            return
+        text = f"frame {PROFILER.last('frame') * 1000:.1f} ms, mean {PROFILER.mean('frame') * 1000:.1f} ms"
+        if self.ai_worker and self.ai_worker.last_info:
+            text += f", ai {self.ai_worker.last_info['nps']} nps"
+        surface = self.font_hud.render(text, True, COLORS['text'], COLORS['button'])
+        self.hud_rect = surface.get_rect(topleft=(4, 4))
+        self.display_surface.blit(surface, self.hud_rect)
+        self.dirty_rects.append(self.hud_rect)
+
+    def close(self):
+        """ Stops the AI worker process, the profile is printed when profiling is on """
+        if PROFILER.enabled:
+            self.print_profile()
+            PROFILER.disable()
+        if self.ai_worker:
+            self.ai_worker.close()
+            self.ai_worker = None
+
     def run(self):
         """ Main game loop that handles events and updates the display """
         while self.running:
-            self.display_surface.fill('black')
-
-            if self.ai_turn and not self.board.game_drawn and not self.board.checkmate:
-                self.ai.make_move()
-                if self.board.pawn_promotion:
-                    self.board.promote_pawn('queen')
-                self.ai_turn = False
-                new_fen = self.board.generate_fen_from_board()
-                self.board.fen_history.append(new_fen)
-                if not self.board.checkmate and not self.board.game_drawn:
-                    self.board.check_game_over()
+            if self.vs_ai:
+                self.update_ai()
+
+            events = pygame.event.get()
+            if not events and not self.dirty_rects and not self.board.dirty_rects and not self.full_redraw:
+                # nothing to draw, sleep until input arrives or the AI worker has to be polled again
+                if self.ai_worker and self.ai_worker.searching:
+                    events = [pygame.event.wait(1000 // FPS)]
+                else:
+                    events = [pygame.event.wait()]
 
             # event handler
-            for event in pygame.event.get():
+            for event in events:
                 if event.type == pygame.QUIT:
+                    self.close()
                     pygame.quit()
                     exit()
                 elif event.type == pygame.MOUSEBUTTONDOWN:
@@ -190,7 +331,20 @@ class Engine:
                         self.handle_mouse_release(event.pos)
                 elif event.type == pygame.MOUSEMOTION:
                     self.handle_mouse_move(event.pos)
+                    self.dirty_rects += [button.rect for button in self.visible_buttons()]  # hover effect
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_BACKSPACE:
+                        self.undo_move()
+                    elif event.key == pygame.K_SPACE and self.vs_ai:
+                        self.ai_worker.stop()  # the AI plays its best move so far
+                    elif event.key == pygame.K_F3:
+                        self.toggle_profiling()
+                    elif event.key == pygame.K_f:
+                        self.flip_board()
+                elif event.type == pygame.WINDOWEXPOSED:
+                    self.full_redraw = True
 
-            self.draw()
+            self.render()
+            self.clock.tick(FPS)
 
-            pygame.display.flip()
+        self.close()
@@ -12,6 +12,7 @@ class Main:
 
         # General attributes
         self.running = True
+        self.clock = pygame.time.Clock()
         self.state = 'menu'  # Default state
         self.player_color = 'white'
         self.vs_ai = False  # Whether the player is playing against the AI
@@ -108,7 +109,19 @@ class Main:
     def run(self):
         """Main loop"""
         while self.running:
-            for event in pygame.event.get():
+            # Draw the current state
+            if self.state == 'menu':
+                self.draw_menu()
+            elif self.state == 'game_mode_menu':
+                self.draw_game_mode_menu()
+            elif self.state == 'color_selection':
+                self.draw_color_selection_menu()
+
+            pygame.display.flip()
+            self.clock.tick(FPS)
+
+            # Sleep until there is input, the menus only change on events
+            for event in [pygame.event.wait()] + pygame.event.get():
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     exit()
@@ -121,16 +134,6 @@ class Main:
                 elif self.state == 'color_selection':
                     self.handle_color_selection_input(event)
 
-            # Draw the current state
-            if self.state == 'menu':
-                self.draw_menu()
-            elif self.state == 'game_mode_menu':
-                self.draw_game_mode_menu()
-            elif self.state == 'color_selection':
-                self.draw_color_selection_menu()
-
-            pygame.display.flip()
-
 
 if __name__ == '__main__':
     main = Main()
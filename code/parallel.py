@@ -0,0 +1,138 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+from ai import AI, INFINITY, SearchAborted
+from position import Position, START_FEN, move_to_uci
+from transposition import EXACT
+from worker import StopSignal
+
+# the AI of a pool process, it keeps its transposition table, killers and history between tasks
+_worker_ai = None
+
+
+def init_pool_worker(color, ai_settings, stop_id):
+    global _worker_ai
+    _worker_ai = AI(color, **ai_settings)
+    _worker_ai.stop_event = StopSignal(stop_id)
+
+
+def search_root_move(task):
+    """ Searches one root move in a pool process, the score is None when the search was stopped """
+    search_id, position, move, depth, alpha, node_limit = task
+    ai = _worker_ai
+    ai.stop_event.search_id = search_id  # the time limit is watched by the main process, it stops the search id
+    ai.nodes = 0
+    ai.quiescence_nodes = 0
+    ai.node_limit = node_limit
+    ai.killers = [[0, 0] for _ in ai.killers]
+    position.push(move)
+    try:
+        score = -ai.negamax(position, depth - 1, -INFINITY, -alpha, 1)
+    except SearchAborted:
+        score = None
+    return move, score, ai.nodes, ai.quiescence_nodes
+
+
+class ParallelAI(AI):
+    """ AI that splits the root moves of every iteration over a pool of processes.
+    The first move is searched alone, its score then bounds the others which are searched side by side """
+
+    SERIAL_DEPTH = 2  # shallow iterations are cheaper than sending the tasks
+
+    def __init__(self, color, workers=None, hash_size=16, **ai_settings):
+        workers = workers or os.cpu_count() or 1
+        # hash_size is the memory of all transposition tables together, this process has one like every pool process
+        table_size = max(1, hash_size // (workers + 1))
+        super().__init__(color, hash_size=table_size, **ai_settings)
+        self.workers = workers
+        self.stop_id = multiprocessing.Value('i', 0)
+        self.search_id = 0
+        # the book is only probed here, the pool processes just search
+        pool_settings = {key: value for key, value in ai_settings.items() if key != 'book_path'}
+        pool_settings['hash_size'] = table_size
+        self.pool = multiprocessing.Pool(self.workers, initializer=init_pool_worker,
+                                         initargs=(color, pool_settings, self.stop_id))
+
+    def close(self):
+        super().close()
+        self.pool.terminate()
+        self.pool.join()
+
+    def stop_requested(self):
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return True
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def run_tasks(self, position, moves, depth, alpha):
+        """ Searches the moves in the pool, yields (move, score) as the results arrive """
+        self.search_id += 1
+        node_limit = self.node_limit - self.nodes if self.node_limit is not None else None
+        tasks = [(self.search_id, position, move, depth, alpha, node_limit) for move in moves]
+        results = self.pool.imap_unordered(search_root_move, tasks)
+        for _ in tasks:
+            while True:
+                if self.stop_requested():
+                    self.stop_id.value = self.search_id  # the pool processes give up their moves
+                try:
+                    move, score, nodes, quiescence_nodes = results.next(timeout=0.01)
+                    break
+                except multiprocessing.TimeoutError:
+                    pass
+            self.nodes += nodes
+            self.quiescence_nodes += quiescence_nodes
+            yield move, score
+
+    def search_root(self, position, moves, depth):
+        """ Same result as the serial root search, a better move found before an abort is kept """
+        if depth <= self.SERIAL_DEPTH or self.workers == 1 or len(moves) == 1:
+            return super().search_root(position, moves, depth)
+
+        aborted = False
+        ((move, alpha),) = self.run_tasks(position, moves[:1], depth, -INFINITY)
+        if alpha is None:
+            raise SearchAborted
+        self.best_move = move
+        self.best_score = alpha
+        # the other moves only have to show that they are better than the first one
+        for move, score in self.run_tasks(position, moves[1:], depth, alpha):
+            if score is None:
+                aborted = True
+            elif score > alpha:
+                alpha = score
+                self.best_move = move
+                self.best_score = score
+        if aborted:
+            raise SearchAborted
+        self.transposition_table.store(position.hash, depth, alpha, EXACT, self.best_move)
+
+
+def benchmark(fen, depth, worker_counts):
+    """ Searches the position to a fixed depth with more and more workers and prints the speedup """
+    base_time = None
+    for workers in worker_counts:
+        ai = ParallelAI('white', workers=workers, depth=depth) if workers > 1 else AI('white', depth=depth)
+        start_time = time.perf_counter()
+        move = ai.find_best_move(Position(fen))
+        elapsed_time = time.perf_counter() - start_time
+        base_time = base_time or elapsed_time
+        nodes = ai.nodes + ai.quiescence_nodes
+        print(f'{workers:>3} workers: {move_to_uci(move)} score {ai.best_score:>6} {nodes:>9} nodes '
+              f'{elapsed_time:7.2f} s  speedup {base_time / elapsed_time:.2f}')
+        if workers > 1:
+            ai.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the parallel search against the serial one')
+    parser.add_argument('fen', nargs='?', default=START_FEN)
+    parser.add_argument('-d', '--depth', type=int, default=5)
+    parser.add_argument('-w', '--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, 8, os.cpu_count() or 1}))
+    args = parser.parse_args()
+    benchmark(args.fen, args.depth, args.workers)
+
+
+if __name__ == '__main__':
+    main()
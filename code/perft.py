@@ -0,0 +1,116 @@
+import argparse
+import sys
+import time
+
+from position import Position, START_FEN, move_to_uci
+
+# reference positions with their known leaf counts per depth
+REFERENCE_POSITIONS = [
+    ('start position', START_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ('rook endgame with en passant', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ('promotions and castling', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('promotion captures', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ('en passant discovers check', '3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1', {6: 1134888}),
+    ('en passant would expose the king', '8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1', {6: 1015133}),
+    ('en passant gives check', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1', {6: 1440467}),
+    ('short castling gives check', '5k2/8/8/8/8/8/8/4K2R w K - 0 1', {6: 661072}),
+    ('long castling gives check', '3k4/8/8/8/8/8/8/R3K3 w Q - 0 1', {6: 803711}),
+    ('castling rights', 'r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1', {4: 1274206}),
+    ('castling prevented', 'r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1', {4: 1720476}),
+    ('promote out of check', '2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1', {6: 3821001}),
+    ('discovered check', '8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1', {5: 1004658}),
+    ('promote to give check', '4k3/1P6/8/8/8/8/K7/8 w - - 0 1', {6: 217342}),
+    ('underpromote to give check', '8/P1k5/K7/8/8/8/8/8 w - - 0 1', {6: 92683}),
+    ('self stalemate', 'K1k5/8/P7/8/8/8/8/8 w - - 0 1', {6: 2217}),
+    ('stalemate and checkmate', '8/k1P5/8/1K6/8/8/8/8 w - - 0 1', {7: 567584}),
+    ('double check', '8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1', {4: 23527}),
+]
+
+
+def perft(position, depth):
+    """ Counts the leaf nodes of the legal move tree, the last ply is counted without playing the moves """
+    moves = position.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.push(move)
+        nodes += perft(position, depth - 1)
+        position.pop()
+    return nodes
+
+
+def divide(position, depth):
+    """ Leaf counts per root move, used to find the move where a generator goes wrong """
+    counts = {}
+    for move in position.legal_moves():
+        position.push(move)
+        counts[move_to_uci(move)] = perft(position, depth - 1)
+        position.pop()
+    return counts
+
+
+def run_perft(fen, depth, show_divide=False):
+    position = Position(fen)
+    start_time = time.perf_counter()
+    if show_divide:
+        counts = divide(position, depth)
+        for move, count in sorted(counts.items()):
+            print(f'{move}: {count}')
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(position, depth)
+    elapsed_time = time.perf_counter() - start_time
+    print(f'depth {depth}: {nodes} nodes in {elapsed_time:.2f} s ({nodes / max(elapsed_time, 1e-9):.0f} nps)')
+    return nodes
+
+
+def run_suite(max_depth, max_nodes):
+    """ Runs every reference position up to the depth limits and reports mismatches """
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, counts in REFERENCE_POSITIONS:
+        for depth in sorted(counts):
+            if depth > max_depth or counts[depth] > max_nodes:
+                continue
+            start_time = time.perf_counter()
+            nodes = perft(Position(fen), depth)
+            elapsed_time = time.perf_counter() - start_time
+            total_nodes += nodes
+            total_time += elapsed_time
+            status = 'ok' if nodes == counts[depth] else f'FAILED, expected {counts[depth]}'
+            failures += nodes != counts[depth]
+            print(f'{name:34} depth {depth}: {nodes:>9} nodes {elapsed_time:7.2f} s  {status}')
+    print(f'total: {total_nodes} nodes in {total_time:.2f} s ({total_nodes / max(total_time, 1e-9):.0f} nps), '
+          f'{failures} failed')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Counts move generator leaf nodes (perft) without a display')
+    parser.add_argument('fen', nargs='?', default=START_FEN, help='position to count, the start position by default')
+    parser.add_argument('-d', '--depth', type=int, default=4)
+    parser.add_argument('--divide', action='store_true', help='print the count of every root move')
+    parser.add_argument('--suite', action='store_true', help='check the built-in reference positions')
+    parser.add_argument('--max-nodes', type=int, default=5_000_000,
+                        help='skip suite entries with more leaf nodes than this')
+    args = parser.parse_args()
+
+    if args.suite:
+        # without an explicit depth every entry of the suite is run
+        max_depth = args.depth if '-d' in sys.argv or '--depth' in sys.argv else 99
+        sys.exit(1 if run_suite(max_depth, args.max_nodes) else 0)
+    run_perft(args.fen, args.depth, args.divide)
+
+
+if __name__ == '__main__':
+    main()
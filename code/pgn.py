@@ -0,0 +1,376 @@
+import argparse
+import multiprocessing
+import os
+import re
+import time
+
+from bitboard import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, bishop_attacks, rook_attacks, queen_attacks
+from position import (Position, START_FEN, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, FILES, parse_square,
+                      square_name, encode_move)
+
+SAN_PIECES = {'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+SAN_LETTERS = {piece_type: letter for letter, piece_type in SAN_PIECES.items()}
+# the seven tag roster comes first in every exported game, in this order
+TAG_ORDER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+CHUNK_BYTES = 8 << 20  # largest part of a file map_games hands to one process call
+
+TAG_PATTERN = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+# comments, variations and annotation glyphs are dropped, move numbers and results are not moves either
+SKIP_PATTERN = re.compile(r'\{[^}]*\}|\$\d+|\d+\.+')
+ESCAPE_PATTERN = re.compile(r'\\(.)')
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+
+class PGNError(ValueError):
+    """ Raised for a move that is not legal or cannot be read in the position it was played in """
+
+
+def scan_line(line, in_comment):
+    """ The line without its semicolon comment and whether a brace comment is still open at its end.
+    Brace comments may span lines, e.g. wrapped clock comments, and their lines are no tags """
+    if in_comment and '}' not in line:
+        return line, True
+    if not in_comment and '{' not in line and ';' not in line:
+        return line, False
+    for index, char in enumerate(line):
+        if in_comment:
+            in_comment = char != '}'
+        elif char == '{':
+            in_comment = True
+        elif char == ';':
+            return line[:index], False  # a semicolon comment runs to the end of the line
+    return line, in_comment
+
+
+def read_games(stream):
+    """ Reads games one by one from a text stream, yields the tags and the movetext of every game """
+    tags = {}
+    movetext = []
+    in_comment = False
+    for line in stream:
+        line = line.strip()
+        if in_comment:
+            text, in_comment = scan_line(line, True)
+            movetext.append(text)
+        elif line.startswith('['):
+            if movetext:
+                yield tags, ' '.join(movetext)
+                tags, movetext = {}, []
+            match = TAG_PATTERN.match(line)
+            if match:
+                tags[match.group(1)] = ESCAPE_PATTERN.sub(r'\1', match.group(2))
+        elif line and not line.startswith('%'):
+            text, in_comment = scan_line(line, False)
+            movetext.append(text)
+    if tags or movetext:
+        yield tags, ' '.join(movetext)
+
+
+def strip_variations(movetext):
+    """ Removes the (possibly nested) side lines, only the main line is kept """
+    if '(' not in movetext:
+        return movetext
+    depth = 0
+    kept = []
+    for char in movetext:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth = max(0, depth - 1)
+        elif not depth:
+            kept.append(char)
+    return ''.join(kept)
+
+
+def san_tokens(movetext):
+    """ The moves of the main line in SAN """
+    movetext = strip_variations(SKIP_PATTERN.sub(' ', movetext))
+    return [token for token in movetext.split() if token not in RESULTS]
+
+
+def origin_squares(position, piece, to_square, capture):
+    """ Bitboard of the squares from which the piece reaches the target, legality is checked by the caller.
+    This is much faster than generating every legal move just to find one of them """
+    us = piece // 6
+    piece_type = piece % 6
+    pieces = position.pieces[piece]
+    occupied = position.colors[WHITE] | position.colors[BLACK]
+    if piece_type == PAWN:
+        if capture:
+            return PAWN_ATTACKS[us ^ 1][to_square] & pieces
+        step = 8 if us == WHITE else -8
+        origin = to_square - step
+        if not 0 <= origin < 64:
+            return 0
+        if pieces >> origin & 1:
+            return 1 << origin
+        # a double step needs the square in between to be empty
+        if to_square // 8 == (3 if us == WHITE else 4) and position.squares[origin] is None:
+            return pieces & (1 << (origin - step))
+        return 0
+    if piece_type == KNIGHT:
+        return KNIGHT_ATTACKS[to_square] & pieces
+    if piece_type == BISHOP:
+        return bishop_attacks(to_square, occupied) & pieces
+    if piece_type == ROOK:
+        return rook_attacks(to_square, occupied) & pieces
+    if piece_type == QUEEN:
+        return queen_attacks(to_square, occupied) & pieces
+    return KING_ATTACKS[to_square] & pieces
+
+
+def keeps_king_safe(position, move):
+    """ Whether a move that follows the piece's movement does not leave the own king in check """
+    us = position.turn
+    position.push(move)
+    safe = not position.is_attacked(position.king_square(us), us ^ 1)
+    position.pop()
+    return safe
+
+
+def parse_san(position, san):
+    """ Finds the legal move written in standard algebraic notation """
+    text = san.rstrip('+#!?')
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        king = position.king_square(position.turn)
+        target = king + 2 if len(text) == 3 else king - 2
+        move = encode_move(king, target)
+        if move in position.legal_moves():
+            return move
+        raise PGNError(f'illegal castling {san} in {position.fen()}')
+
+    match = SAN_PATTERN.match(text)
+    if not match:
+        raise PGNError(f'cannot read the move {san}')
+    piece_letter, from_file, from_rank, target, promotion = match.groups()
+    piece_type = SAN_PIECES[piece_letter] if piece_letter else PAWN
+    piece = position.turn * 6 + piece_type
+    to_square = parse_square(target)
+    promotion = SAN_PIECES[promotion] if promotion else 0
+
+    target_piece = position.squares[to_square]
+    if target_piece is not None and target_piece // 6 == position.turn:
+        origins = 0
+    elif piece_type == PAWN:
+        # a pawn reaching the last rank has to promote, no other move does
+        if bool(promotion) != (to_square // 8 in (0, 7)):
+            origins = 0
+        else:
+            capture = target_piece is not None or to_square == position.en_passant
+            origins = origin_squares(position, piece, to_square, capture)
+    else:
+        origins = 0 if promotion else origin_squares(position, piece, to_square, False)
+
+    candidates = []
+    while origins:
+        low_bit = origins & -origins
+        from_square = low_bit.bit_length() - 1
+        origins ^= low_bit
+        if from_file and FILES[from_square % 8] != from_file or from_rank and str(from_square // 8 + 1) != from_rank:
+            continue
+        move = encode_move(from_square, to_square, promotion)
+        if keeps_king_safe(position, move):
+            candidates.append(move)
+    if len(candidates) != 1:
+        reason = 'illegal' if not candidates else 'ambiguous'
+        raise PGNError(f'{reason} move {san} in {position.fen()}')
+    return candidates[0]
+
+
+def game_positions(tags, movetext):
+    """ Plays through the main line of a game, yields the position before every move and the move """
+    try:
+        position = Position(tags.get('FEN', START_FEN))
+    except (ValueError, IndexError, KeyError) as error:
+        raise PGNError(f"cannot set up the FEN {tags['FEN']}: {error}") from None
+    for san in san_tokens(movetext):
+        move = parse_san(position, san)
+        yield position, move
+        position.push(move)
+
+
+def move_to_san(position, move):
+    """ Writes a legal move in standard algebraic notation, including check and mate """
+    from_square, to_square, promotion = move & 63, (move >> 6) & 63, move >> 12
+    piece = position.squares[from_square]
+    piece_type = piece % 6
+    if piece_type == KING and abs(to_square - from_square) == 2:
+        san = 'O-O' if to_square > from_square else 'O-O-O'
+    else:
+        capture = position.squares[to_square] is not None or piece_type == PAWN and to_square == position.en_passant
+        if piece_type == PAWN:
+            san = FILES[from_square % 8] + 'x' if capture else ''
+        else:
+            san = SAN_LETTERS[piece_type]
+            # other pieces of the same kind that can reach the square make the origin necessary
+            others = []
+            origins = origin_squares(position, piece, to_square, capture) & ~(1 << from_square)
+            while origins:
+                low_bit = origins & -origins
+                other = low_bit.bit_length() - 1
+                origins ^= low_bit
+                if keeps_king_safe(position, encode_move(other, to_square)):
+                    others.append(other)
+            if others:
+                if all(other % 8 != from_square % 8 for other in others):
+                    san += FILES[from_square % 8]
+                elif all(other // 8 != from_square // 8 for other in others):
+                    san += str(from_square // 8 + 1)
+                else:
+                    san += square_name(from_square)
+            if capture:
+                san += 'x'
+        san += square_name(to_square)
+        if promotion:
+            san += '=' + SAN_LETTERS[promotion]
+    position.push(move)
+    if position.in_check():
+        san += '#' if not position.legal_moves() else '+'
+    position.pop()
+    return san
+
+
+def escape_tag(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def format_game(tags, sans, result, first_move=1, black_first=False):
+    """ PGN text of a game: tags, then the movetext wrapped at 80 columns """
+    names = [name for name in TAG_ORDER if name in tags] + [name for name in tags if name not in TAG_ORDER]
+    lines = [f'[{name} "{escape_tag(tags[name])}"]' for name in names]
+    lines.append('')
+    tokens = []
+    number = first_move
+    for index, san in enumerate(sans):
+        white_move = (index % 2 == 0) != black_first
+        if white_move:
+            tokens.append(f'{number}.')
+        elif index == 0:
+            tokens.append(f'{number}...')
+        tokens.append(san)
+        if not white_move:
+            number += 1
+    tokens.append(result)
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+
+def split_file(path, parts):
+    """ Byte ranges of the file that start at a game, so each range can be read on its own.
+    A game starts with a tag line that follows a line that is not a tag and is not inside a brace comment.
+    The line at the guess is skipped as it is usually cut in the middle. A comment that was already open there
+    is closed by a brace that scan_line ignores, and a comment line such as [%clk 0:01:00] is no tag """
+    size = os.path.getsize(path)
+    starts = [0]
+    with open(path, 'rb') as file:
+        for part in range(1, parts):
+            offset = max(size * part // parts, starts[-1])
+            file.seek(offset)
+            offset += len(file.readline())
+            line = file.readline()
+            offset += len(line)
+            previous = line.decode('latin-1').strip()
+            previous_tag = bool(TAG_PATTERN.match(previous))
+            in_comment = not previous_tag and scan_line(previous, False)[1]
+            while True:
+                line = file.readline()
+                if not line:
+                    break
+                text = line.decode('latin-1').strip()
+                is_tag = not in_comment and bool(TAG_PATTERN.match(text))
+                if is_tag and not previous_tag:
+                    break
+                if not is_tag:
+                    _, in_comment = scan_line(text, in_comment)
+                previous_tag = is_tag
+                offset += len(line)
+            if line and offset > starts[-1]:
+                starts.append(offset)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def read_lines(path, start, end):
+    """ The lines of a byte range, a range from split_file contains whole games """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while start < end:
+            line = file.readline()
+            if not line:
+                break
+            start += len(line)
+            yield line.decode('utf-8', 'replace')
+
+
+def process_range(task):
+    function, path, start, end, arguments = task
+    return function(read_games(read_lines(path, start, end)), *arguments)
+
+
+def map_games(paths, function, workers=None, arguments=()):
+    """ Splits the files at game boundaries and calls function(games, *arguments) for every part in a process
+    pool, games being the (tags, movetext) generator of the part. Yields the results as the parts finish.
+    The function has to be defined at module level so the pool can send it to its processes """
+    workers = workers or os.cpu_count() or 1
+    # more parts than workers even out their sizes, and no part is much larger than CHUNK_BYTES, so the result
+    # of a part stays small however large the file is
+    tasks = [(function, path, start, end, arguments) for path in paths
+             for start, end in split_file(path, max(workers * 4, os.path.getsize(path) // CHUNK_BYTES + 1))]
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(process_range, tasks)
+
+
+def normalize_games(games):
+    """ Replays the games and formats them again with clean SAN, a game with an illegal move is skipped.
+    Returns the PGN text and the numbers of games, skipped games and moves """
+    texts = []
+    skipped = moves = 0
+    for tags, movetext in games:
+        sans = []
+        try:
+            for position, move in game_positions(tags, movetext):
+                if not sans:
+                    first_move, black_first = position.full_move, position.turn == BLACK
+                sans.append(move_to_san(position, move))
+        except PGNError:
+            skipped += 1
+            continue
+        if not sans:
+            first_move, black_first = 1, False
+        moves += len(sans)
+        texts.append(format_game(tags, sans, tags.get('Result', '*'), first_move, black_first))
+    return ''.join(texts), len(texts), skipped, moves
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays PGN files and writes the games again with clean SAN')
+    parser.add_argument('pgn', nargs='+')
+    parser.add_argument('-o', '--output', help='PGN file to write, the games are only checked without one')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    games = skipped = moves = 0
+    output = open(args.output, 'w') if args.output else None
+    for text, part_games, part_skipped, part_moves in map_games(args.pgn, normalize_games, args.workers):
+        if output:
+            output.write(text)
+        games += part_games
+        skipped += part_skipped
+        moves += part_moves
+    if output:
+        output.close()
+    elapsed_time = time.perf_counter() - start_time
+    print(f'{games} games with {moves} moves in {elapsed_time:.1f} s ({moves / elapsed_time:.0f} moves per second), '
+          f'{skipped} games skipped')
+
+
+if __name__ == '__main__':
+    main()
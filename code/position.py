@@ -0,0 +1,534 @@
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS, compute_hash
+from evaluation import MIDGAME_TABLES, ENDGAME_TABLES, PHASE_WEIGHTS, compute_scores
+from bitboard import (FULL, FILE_A, FILE_H, RANK_1, RANK_8, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN,
+                      LINE, rook_attacks, bishop_attacks, queen_attacks)
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+COLOR_NAMES = ['white', 'black']
+PIECE_TYPES = ['pawn', 'knight', 'bishop', 'rook', 'queen', 'king']
+PIECE_SYMBOLS = 'PNBRQKpnbrqk'
+# piece codes are color * 6 + type, the names match the image keys of the graphics folder
+PIECE_NAMES = [f'{COLOR_NAMES[piece // 6]}_{PIECE_TYPES[piece % 6]}' for piece in range(12)]
+
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+CASTLING_SYMBOLS = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+FILES = 'abcdefgh'
+
+RANK_3 = RANK_1 << 16
+RANK_6 = RANK_1 << 40
+
+# (color, king square, rook square) each castling right needs
+CASTLING_PIECES = {WHITE_KINGSIDE: (WHITE, 4, 7), WHITE_QUEENSIDE: (WHITE, 4, 0),
+                   BLACK_KINGSIDE: (BLACK, 60, 63), BLACK_QUEENSIDE: (BLACK, 60, 56)}
+
+# castling rights that survive a move from or to the given square
+CASTLING_MASKS = [15] * 64
+CASTLING_MASKS[0] = 15 ^ WHITE_QUEENSIDE
+CASTLING_MASKS[4] = 15 ^ (WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[7] = 15 ^ WHITE_KINGSIDE
+CASTLING_MASKS[56] = 15 ^ BLACK_QUEENSIDE
+CASTLING_MASKS[60] = 15 ^ (BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[63] = 15 ^ BLACK_KINGSIDE
+
+
+def square_name(square):
+    """ Converts a square index (a1 = 0, h8 = 63) into its algebraic name """
+    return f'{FILES[square % 8]}{square // 8 + 1}'
+
+
+def parse_square(name):
+    """ Converts an algebraic square name into its index """
+    return (int(name[1]) - 1) * 8 + FILES.index(name[0])
+
+
+def encode_move(from_square, to_square, promotion=0):
+    """ Packs a move into a single integer, the promotion is a piece type or 0 """
+    return from_square | (to_square << 6) | (promotion << 12)
+
+
+def move_from(move):
+    return move & 63
+
+
+def move_to(move):
+    return (move >> 6) & 63
+
+
+def move_promotion(move):
+    return move >> 12
+
+
+def move_to_uci(move):
+    """ Formats a move in long algebraic notation, e.g. e7e8q """
+    promotion = move_promotion(move)
+    suffix = PIECE_SYMBOLS[6 + promotion] if promotion else ''
+    return f'{square_name(move_from(move))}{square_name(move_to(move))}{suffix}'
+
+
+def parse_uci(text):
+    """ Converts a move in long algebraic notation into its integer form """
+    promotion = PIECE_SYMBOLS.index(text[4].lower()) - 6 if len(text) > 4 else 0
+    return encode_move(parse_square(text[:2]), parse_square(text[2:4]), promotion)
+
+
+def add_moves(moves, from_square, targets):
+    """ Appends a move from the square to every square of the targets bitboard """
+    while targets:
+        low_bit = targets & -targets
+        moves.append(from_square | ((low_bit.bit_length() - 1) << 6))
+        targets ^= low_bit
+
+
+class Position:
+    """ Headless chess position: pieces, side to move, castling, en-passant and move clocks """
+
+    def __init__(self, fen=START_FEN):
+        self.squares = [None] * 64
+        self.pieces = [0] * 12  # one bitboard per piece code
+        self.colors = [0, 0]  # occupied squares per color
+        self.turn = WHITE
+        self.castling = 0
+        self.en_passant = None
+        self.half_move = 0
+        self.full_move = 1
+        self.hash = 0  # Zobrist key, updated with every move
+        self.move_stack = []  # (move, captured piece, castling, en-passant, half-move clock, hash, scores) per move
+
+        # evaluation terms, updated with every move: middlegame and endgame score for white and the game phase
+        self.midgame = 0
+        self.endgame = 0
+        self.phase = 0
+
+        # occurrences of each hash since the last pawn move or capture, earlier counts are stacked away
+        self.repetitions = {}
+        self.repetition_stack = []
+        self.move_cache = None  # (hash, legal moves) of the last position cached_legal_moves generated for
+        self.load_fen(fen)
+
+    def __repr__(self):
+        return f'Position({self.fen()!r})'
+
+    @property
+    def white_to_move(self):
+        return self.turn == WHITE
+
+    def copy(self):
+        """ Returns an independent copy of the position """
+        position = Position.__new__(Position)
+        position.squares = self.squares[:]
+        position.pieces = self.pieces[:]
+        position.colors = self.colors[:]
+        position.turn = self.turn
+        position.castling = self.castling
+        position.en_passant = self.en_passant
+        position.half_move = self.half_move
+        position.full_move = self.full_move
+        position.hash = self.hash
+        position.midgame = self.midgame
+        position.endgame = self.endgame
+        position.phase = self.phase
+        position.move_stack = self.move_stack[:]
+        position.repetitions = dict(self.repetitions)
+        position.repetition_stack = [dict(repetitions) for repetitions in self.repetition_stack]
+        position.move_cache = self.move_cache
+        return position
+
+    def load_fen(self, fen):
+        """ Sets up the position from a FEN string, missing clock fields default to 0 and 1 """
+        fields = fen.split()
+        self.squares = [None] * 64
+        self.pieces = [0] * 12
+        self.colors = [0, 0]
+        file = 0
+        rank = 7
+        for symbol in fields[0]:
+            if symbol == '/':
+                file = 0
+                rank -= 1
+            elif symbol.isdigit():
+                file += int(symbol)
+            else:
+                piece = PIECE_SYMBOLS.index(symbol)
+                self.squares[rank * 8 + file] = piece
+                self.pieces[piece] |= 1 << (rank * 8 + file)
+                self.colors[piece // 6] |= 1 << (rank * 8 + file)
+                file += 1
+
+        self.turn = WHITE if len(fields) < 2 or fields[1] == 'w' else BLACK
+        self.castling = 0
+        for symbol in fields[2] if len(fields) > 2 else '-':
+            self.castling |= CASTLING_SYMBOLS.get(symbol, 0)
+        # a right is only kept while its king and rook are still on their home squares
+        for right, (color, king, rook) in CASTLING_PIECES.items():
+            if self.squares[king] != color * 6 + KING or self.squares[rook] != color * 6 + ROOK:
+                self.castling &= ~right
+        self.en_passant = parse_square(fields[3]) if len(fields) > 3 and fields[3] != '-' else None
+        # like push, only keep the square if a pawn can capture, so the hash does not depend on how it was written
+        if (self.en_passant is not None
+                and not PAWN_ATTACKS[self.turn ^ 1][self.en_passant] & self.pieces[self.turn * 6 + PAWN]):
+            self.en_passant = None
+        self.half_move = int(fields[4]) if len(fields) > 4 else 0
+        self.full_move = int(fields[5]) if len(fields) > 5 else 1
+        self.validate()
+        self.hash = compute_hash(self)
+        self.midgame, self.endgame, self.phase = compute_scores(self)
+        self.move_stack = []
+        self.repetitions = {self.hash: 1}
+        self.repetition_stack = []
+        self.move_cache = None
+
+    def validate(self):
+        """ Raises ValueError for positions the move generator cannot handle """
+        for color in (WHITE, BLACK):
+            if bin(self.pieces[color * 6 + KING]).count('1') != 1:
+                raise ValueError(f'{COLOR_NAMES[color]} needs exactly one king')
+        if self.is_attacked(self.king_square(self.turn ^ 1), self.turn):
+            raise ValueError('the side not to move is in check')
+
+    def fen(self):
+        """ Generates the FEN string of the position """
+        rows = []
+        for rank in range(7, -1, -1):
+            row = ''
+            empty_count = 0
+            for file in range(8):
+                piece = self.squares[rank * 8 + file]
+                if piece is None:
+                    empty_count += 1
+                else:
+                    if empty_count:
+                        row += str(empty_count)
+                        empty_count = 0
+                    row += PIECE_SYMBOLS[piece]
+            if empty_count:
+                row += str(empty_count)
+            rows.append(row)
+
+        castling = ''.join(symbol for symbol, right in CASTLING_SYMBOLS.items() if self.castling & right) or '-'
+        en_passant = square_name(self.en_passant) if self.en_passant is not None else '-'
+        turn = 'w' if self.turn == WHITE else 'b'
+        return f"{'/'.join(rows)} {turn} {castling} {en_passant} {self.half_move} {self.full_move}"
+
+    def king_square(self, color):
+        return self.pieces[color * 6 + KING].bit_length() - 1
+
+    def attackers(self, square, by_color, occupied):
+        """ Bitboard of the pieces of by_color attacking the square, sliders see through missing occupancy """
+        pieces = self.pieces
+        offset = by_color * 6
+        # a pawn attacks the square if a pawn of the other color on the square would attack the pawn
+        return (PAWN_ATTACKS[by_color ^ 1][square] & pieces[offset + PAWN]
+                | KNIGHT_ATTACKS[square] & pieces[offset + KNIGHT]
+                | KING_ATTACKS[square] & pieces[offset + KING]
+                | bishop_attacks(square, occupied) & (pieces[offset + BISHOP] | pieces[offset + QUEEN])
+                | rook_attacks(square, occupied) & (pieces[offset + ROOK] | pieces[offset + QUEEN]))
+
+    def is_attacked(self, square, by_color):
+        """ Checks whether any piece of by_color attacks the square """
+        return bool(self.attackers(square, by_color, self.colors[WHITE] | self.colors[BLACK]))
+
+    def in_check(self):
+        return self.is_attacked(self.king_square(self.turn), self.turn ^ 1)
+
+    def is_repetition(self, count=3):
+        """ Checks whether the current position occurred at least count times """
+        return self.repetitions[self.hash] >= count
+
+    def is_fifty_moves(self):
+        """ Fifty moves by each side without a pawn move or capture """
+        return self.half_move >= 100
+
+    def pinned_pieces(self, king, occupied):
+        """ Own pieces that are the only blocker between the king and an enemy slider """
+        pieces = self.pieces
+        them = self.turn ^ 1
+        offset = them * 6
+        enemy = self.colors[them]
+        # look from the king through the own pieces onto the enemy sliders
+        snipers = (rook_attacks(king, enemy) & (pieces[offset + ROOK] | pieces[offset + QUEEN])
+                   | bishop_attacks(king, enemy) & (pieces[offset + BISHOP] | pieces[offset + QUEEN]))
+        pinned = 0
+        while snipers:
+            low_bit = snipers & -snipers
+            blockers = BETWEEN[king][low_bit.bit_length() - 1] & occupied
+            if blockers and not blockers & (blockers - 1):
+                pinned |= blockers
+            snipers ^= low_bit
+        return pinned & self.colors[self.turn]
+
+    def cached_legal_moves(self):
+        """ Legal moves generated once per position for callers that ask for them repeatedly, e.g. the UI.
+        A move or undo changes the hash, which invalidates the list. It is shared, so it must not be changed """
+        if self.move_cache is None or self.move_cache[0] != self.hash:
+            self.move_cache = (self.hash, self.legal_moves())
+        return self.move_cache[1]
+
+    def legal_moves(self, captures_only=False):
+        """ Generates the legal moves, check and pin information is computed once for the whole position.
+        With captures_only only captures and promotions are generated, for the quiescence search """
+        moves = []
+        pieces = self.pieces
+        us = self.turn
+        them = us ^ 1
+        offset = us * 6
+        own = self.colors[us]
+        occupied = own | self.colors[them]
+        not_own = ~own & FULL
+        if captures_only:
+            not_own &= self.colors[them]
+        king = pieces[offset + KING].bit_length() - 1
+
+        # the king may not step onto attacked squares, it does not shield those behind itself from sliders
+        without_king = occupied ^ (1 << king)
+        targets = KING_ATTACKS[king] & not_own
+        while targets:
+            low_bit = targets & -targets
+            square = low_bit.bit_length() - 1
+            if not self.attackers(square, them, without_king):
+                moves.append(king | (square << 6))
+            targets ^= low_bit
+
+        checkers = self.attackers(king, them, occupied)
+        if checkers & (checkers - 1):
+            return moves  # double check, only the king can move
+        if checkers:
+            # capture the checking piece or block the line to the king
+            check_mask = checkers | BETWEEN[king][checkers.bit_length() - 1]
+        else:
+            check_mask = FULL
+            if not captures_only:
+                self.generate_castling_moves(king, occupied, moves)
+
+        pinned = self.pinned_pieces(king, occupied)
+        self.generate_pawn_moves(moves, king, check_mask, pinned, captures_only)
+        not_own &= check_mask
+
+        # pinned knights can never move
+        bitboard = pieces[offset + KNIGHT] & ~pinned
+        while bitboard:
+            low_bit = bitboard & -bitboard
+            square = low_bit.bit_length() - 1
+            add_moves(moves, square, KNIGHT_ATTACKS[square] & not_own)
+            bitboard ^= low_bit
+
+        # pinned sliders stay on the line through the king and the pinning piece
+        for piece_type, attacks in ((BISHOP, bishop_attacks), (ROOK, rook_attacks), (QUEEN, queen_attacks)):
+            bitboard = pieces[offset + piece_type]
+            while bitboard:
+                low_bit = bitboard & -bitboard
+                square = low_bit.bit_length() - 1
+                targets = attacks(square, occupied) & not_own
+                if low_bit & pinned:
+                    targets &= LINE[king][square]
+                add_moves(moves, square, targets)
+                bitboard ^= low_bit
+        return moves
+
+    def generate_pawn_moves(self, moves, king, check_mask, pinned, captures_only=False):
+        """ Pushes, double pushes, captures, en-passant and promotions of all pawns at once """
+        pawns = self.pieces[self.turn * 6 + PAWN]
+        empty = ~(self.colors[WHITE] | self.colors[BLACK]) & FULL
+        enemy = self.colors[self.turn ^ 1]
+
+        # each target set comes with the distance back to the pawn's square
+        if self.turn == WHITE:
+            single = (pawns << 8) & empty
+            targets = ((single, -8), (((single & RANK_3) << 8) & empty, -16),
+                       (((pawns & ~FILE_A) << 7) & enemy, -7), (((pawns & ~FILE_H) << 9) & enemy, -9))
+            promotion_rank = RANK_8
+        else:
+            single = (pawns >> 8) & empty
+            targets = ((single, 8), (((single & RANK_6) >> 8) & empty, 16),
+                       (((pawns & ~FILE_A) >> 9) & enemy, 9), (((pawns & ~FILE_H) >> 7) & enemy, 7))
+            promotion_rank = RANK_1
+        if captures_only:
+            # of the pushes only the promotions are kept
+            targets = ((single & promotion_rank, targets[0][1]),) + targets[2:]
+
+        for bitboard, back in targets:
+            bitboard &= check_mask
+            while bitboard:
+                low_bit = bitboard & -bitboard
+                square = low_bit.bit_length() - 1
+                bitboard ^= low_bit
+                from_square = square + back
+                if (1 << from_square) & pinned and not LINE[king][from_square] & low_bit:
+                    continue
+                if low_bit & promotion_rank:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        moves.append(encode_move(from_square, square, promotion))
+                else:
+                    moves.append(from_square | (square << 6))
+
+        if self.en_passant is not None:
+            self.generate_en_passant_moves(moves, pawns, king)
+
+    def generate_en_passant_moves(self, moves, pawns, king):
+        """ En-passant removes two pawns from the same rank, so its legality is checked on the resulting occupancy """
+        us = self.turn
+        them = us ^ 1
+        target = self.en_passant
+        captured_square = target - 8 if us == WHITE else target + 8
+        attackers = PAWN_ATTACKS[them][target] & pawns
+        while attackers:
+            low_bit = attackers & -attackers
+            from_square = low_bit.bit_length() - 1
+            attackers ^= low_bit
+            occupied = ((self.colors[WHITE] | self.colors[BLACK]) ^ low_bit ^ (1 << captured_square)) | (1 << target)
+            if not self.attackers(king, them, occupied) & ~(1 << captured_square):
+                moves.append(from_square | (target << 6))
+
+    def generate_castling_moves(self, square, occupied, moves):
+        """ Castling is only possible with rights, empty squares and no attacked square on the king's path """
+        kingside, queenside = (WHITE_KINGSIDE, WHITE_QUEENSIDE) if self.turn == WHITE else (BLACK_KINGSIDE,
+                                                                                             BLACK_QUEENSIDE)
+        if not self.castling & (kingside | queenside):
+            return
+        them = self.turn ^ 1
+        rooks = self.pieces[self.turn * 6 + ROOK]
+        if self.castling & kingside and rooks >> (square + 3) & 1 and not occupied & (0b110 << square):
+            if not self.is_attacked(square + 1, them) and not self.is_attacked(square + 2, them):
+                moves.append(encode_move(square, square + 2))
+        if self.castling & queenside and rooks >> (square - 4) & 1 and not occupied & (0b111 << (square - 3)):
+            if not self.is_attacked(square - 1, them) and not self.is_attacked(square - 2, them):
+                moves.append(encode_move(square, square - 2))
+
+    def push(self, move):
+        """ Plays a move in place and records what is needed to take it back, the move has to be legal """
+        squares = self.squares
+        pieces = self.pieces
+        colors = self.colors
+        us = self.turn
+        from_square, to_square, promotion = move & 63, (move >> 6) & 63, move >> 12
+        piece = squares[from_square]
+        piece_type = piece % 6
+        captured = squares[to_square]
+        captured_square = to_square
+
+        if piece_type == PAWN and to_square == self.en_passant:
+            # the captured pawn stands behind the target square
+            captured_square = to_square - 8 if us == WHITE else to_square + 8
+            captured = squares[captured_square]
+            squares[captured_square] = None
+
+        self.move_stack.append((move, captured, self.castling, self.en_passant, self.half_move, self.hash,
+                                self.midgame, self.endgame, self.phase))
+        key = self.hash ^ SIDE_KEY ^ PIECE_KEYS[piece][from_square]
+        midgame = self.midgame - MIDGAME_TABLES[piece][from_square]
+        endgame = self.endgame - ENDGAME_TABLES[piece][from_square]
+
+        if captured is not None:
+            pieces[captured] ^= 1 << captured_square
+            colors[us ^ 1] ^= 1 << captured_square
+            key ^= PIECE_KEYS[captured][captured_square]
+            midgame -= MIDGAME_TABLES[captured][captured_square]
+            endgame -= ENDGAME_TABLES[captured][captured_square]
+            self.phase -= PHASE_WEIGHTS[captured]
+
+        squares[from_square] = None
+        colors[us] ^= (1 << from_square) | (1 << to_square)
+        if promotion:
+            pieces[piece] ^= 1 << from_square
+            piece = us * 6 + promotion
+            pieces[piece] ^= 1 << to_square
+            self.phase += PHASE_WEIGHTS[piece]
+        else:
+            pieces[piece] ^= (1 << from_square) | (1 << to_square)
+        squares[to_square] = piece
+        key ^= PIECE_KEYS[piece][to_square]
+        midgame += MIDGAME_TABLES[piece][to_square]
+        endgame += ENDGAME_TABLES[piece][to_square]
+
+        if piece_type == KING and abs(to_square - from_square) == 2:
+            rook_from, rook_to = self.move_castling_rook(from_square, to_square)
+            rook = us * 6 + ROOK
+            key ^= PIECE_KEYS[rook][rook_from] ^ PIECE_KEYS[rook][rook_to]
+            midgame += MIDGAME_TABLES[rook][rook_to] - MIDGAME_TABLES[rook][rook_from]
+            endgame += ENDGAME_TABLES[rook][rook_to] - ENDGAME_TABLES[rook][rook_from]
+        self.midgame = midgame
+        self.endgame = endgame
+
+        # only remember the en-passant square if an enemy pawn could actually capture
+        if self.en_passant is not None:
+            key ^= EN_PASSANT_KEYS[self.en_passant % 8]
+        self.en_passant = None
+        if piece_type == PAWN and abs(to_square - from_square) == 16:
+            en_passant = (from_square + to_square) // 2
+            if PAWN_ATTACKS[us][en_passant] & pieces[(us ^ 1) * 6 + PAWN]:
+                self.en_passant = en_passant
+                key ^= EN_PASSANT_KEYS[en_passant % 8]
+
+        key ^= CASTLING_KEYS[self.castling]
+        self.castling &= CASTLING_MASKS[from_square] & CASTLING_MASKS[to_square]
+        self.hash = key ^ CASTLING_KEYS[self.castling]
+        if piece_type == PAWN or captured is not None:
+            # no earlier position can come back after an irreversible move
+            self.half_move = 0
+            self.repetition_stack.append(self.repetitions)
+            self.repetitions = {self.hash: 1}
+        else:
+            self.half_move += 1
+            self.repetitions[self.hash] = self.repetitions.get(self.hash, 0) + 1
+        if us == BLACK:
+            self.full_move += 1
+        self.turn ^= 1
+
+    def pop(self):
+        """ Takes back the last move and returns it """
+        if self.half_move == 0:
+            self.repetitions = self.repetition_stack.pop()
+        else:
+            count = self.repetitions[self.hash] - 1
+            if count:
+                self.repetitions[self.hash] = count
+            else:
+                del self.repetitions[self.hash]
+        (move, captured, self.castling, self.en_passant, self.half_move, self.hash,
+         self.midgame, self.endgame, self.phase) = self.move_stack.pop()
+        squares = self.squares
+        pieces = self.pieces
+        colors = self.colors
+        self.turn ^= 1
+        us = self.turn
+        if us == BLACK:
+            self.full_move -= 1
+        from_square, to_square, promotion = move & 63, (move >> 6) & 63, move >> 12
+        piece = squares[to_square]
+
+        if piece % 6 == KING and abs(to_square - from_square) == 2:
+            self.move_castling_rook(from_square, to_square)
+
+        colors[us] ^= (1 << from_square) | (1 << to_square)
+        if promotion:
+            pieces[piece] ^= 1 << to_square
+            piece = us * 6 + PAWN
+            pieces[piece] ^= 1 << from_square
+        else:
+            pieces[piece] ^= (1 << from_square) | (1 << to_square)
+        squares[from_square] = piece
+        squares[to_square] = None
+
+        if captured is not None:
+            captured_square = to_square
+            if piece % 6 == PAWN and to_square == self.en_passant:
+                captured_square = to_square - 8 if us == WHITE else to_square + 8
+            squares[captured_square] = captured
+            pieces[captured] ^= 1 << captured_square
+            colors[us ^ 1] ^= 1 << captured_square
+        return move
+
+    def move_castling_rook(self, king_from, king_to):
+        """ Moves the rook next to the king and returns its squares, calling it again moves it back """
+        if king_to > king_from:
+            rook_from, rook_to = king_from + 3, king_from + 1
+        else:
+            rook_from, rook_to = king_from - 4, king_from - 1
+        rook_move = (1 << rook_from) | (1 << rook_to)
+        self.pieces[self.turn * 6 + ROOK] ^= rook_move
+        self.colors[self.turn] ^= rook_move
+        self.squares[rook_to], self.squares[rook_from] = self.squares[rook_from], self.squares[rook_to]
+        return rook_from, rook_to
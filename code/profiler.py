@@ -0,0 +1,163 @@
+import argparse
+import json
+import sys
+import time
+
+# section: (module, class, method) of the timed methods. While profiling is on the methods are replaced by
+# timing wrappers, while it is off the original methods run and nothing is measured
+SECTIONS = [
+    ('move generation', 'position', 'Position', 'legal_moves'),
+    ('legality', 'position', 'Position', 'attackers'),
+    ('legality', 'position', 'Position', 'pinned_pieces'),
+    ('evaluation', 'ai', 'AI', 'evaluate'),
+    ('search', 'ai', 'AI', 'find_best_move'),
+    ('frame', 'engine', 'Engine', 'render'),
+    ('draw board', 'board', 'Board', 'draw_board'),
+    ('draw pieces', 'engine', 'Engine', 'draw_pieces'),
+    ('draw buttons', 'button', 'Button', 'draw'),
+]
+
+
+class Profiler:
+    """ Call counts and times of the hot paths, switched on and off at runtime """
+
+    def __init__(self):
+        self.enabled = False
+        self.originals = {}  # (owner, name): original function, restored by disable
+        self.timers = {}  # section: [calls, total seconds, seconds of the last call]
+        self.counters = {}  # name: value, added up with count
+        self.profiled_time = 0.0  # seconds profiling was on, the shares of the report are relative to it
+        self.start_time = None
+
+    def wrap(self, section, function):
+        timers = self.timers
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start_time = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed_time = perf_counter() - start_time
+                timer = timers[section]
+                timer[0] += 1
+                timer[1] += elapsed_time
+                timer[2] = elapsed_time
+        timed.__wrapped__ = function
+        timed.__name__ = function.__name__
+        timed.__doc__ = function.__doc__
+        return timed
+
+    def enable(self):
+        """ Patches the sections whose module is imported, so the headless tools never load pygame through it """
+        if self.enabled:
+            return
+        for section, module_name, class_name, name in SECTIONS:
+            module = sys.modules.get(module_name)
+            if module is None:
+                continue
+            owner = getattr(module, class_name)
+            self.timers.setdefault(section, [0, 0.0, 0.0])
+            self.originals[(owner, name)] = getattr(owner, name)
+            setattr(owner, name, self.wrap(section, getattr(owner, name)))
+        self.enabled = True
+        self.start_time = time.perf_counter()
+
+    def disable(self):
+        """ Puts the original functions back, the measurements are kept for the report """
+        for (owner, name), function in self.originals.items():
+            setattr(owner, name, function)
+        self.originals = {}
+        if self.enabled:
+            self.profiled_time += time.perf_counter() - self.start_time
+        self.enabled = False
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    def reset(self):
+        for timer in self.timers.values():
+            timer[:] = [0, 0.0, 0.0]  # changed in place, the wrappers hold on to the dict
+        self.counters = {}
+        self.profiled_time = 0.0
+        if self.enabled:
+            self.start_time = time.perf_counter()
+
+    def count(self, name, value=1):
+        """ Adds to a counter, e.g. the nodes of a search, only while profiling is on """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def last(self, section):
+        """ Seconds of the most recent call of a section, 0 before the first call """
+        return self.timers.get(section, (0, 0.0, 0.0))[2]
+
+    def mean(self, section):
+        calls, total, _ = self.timers.get(section, (0, 0.0, 0.0))
+        return total / calls if calls else 0.0
+
+    def stats(self):
+        """ The measurements as a dict that can be sent between processes or dumped as JSON """
+        wall_time = self.profiled_time + (time.perf_counter() - self.start_time if self.enabled else 0.0)
+        return {'wall_time': wall_time,
+                'sections': {section: {'calls': calls, 'total': total} for section, (calls, total, _)
+                             in self.timers.items()},
+                'counters': dict(self.counters)}
+
+    def report(self, as_json=False):
+        return format_report(self.stats(), as_json)
+
+
+def format_report(stats, as_json=False):
+    """ Table of the sections sorted by total time, the share is of the time profiling was on.
+    Sections may contain each other, e.g. the search contains the evaluation, so the shares do not add up """
+    if as_json:
+        return json.dumps(stats, indent=2)
+    wall_time = stats['wall_time'] or 1e-9
+    lines = [f"{'section':<16} {'calls':>10} {'total ms':>11} {'mean us':>10} {'share':>7}"]
+    for section, timer in sorted(stats['sections'].items(), key=lambda item: -item[1]['total']):
+        calls, total = timer['calls'], timer['total']
+        if not calls:
+            continue
+        mean = total / calls * 1e6
+        lines.append(f'{section:<16} {calls:>10} {total * 1000:>11.1f} {mean:>10.1f} {total / wall_time:>6.1%}')
+    for name, value in sorted(stats['counters'].items()):
+        lines.append(f'{name:<16} {value:>10}')
+    lines.append(f'wall time {wall_time:.2f} s')
+    return '\n'.join(lines)
+
+
+# the profiler of this process, the game and the search worker each have their own
+PROFILER = Profiler()
+
+
+def main():
+    from ai import AI
+    from position import Position, START_FEN, COLOR_NAMES
+
+    parser = argparse.ArgumentParser(description='Profiles a search of a position and prints where the time goes')
+    parser.add_argument('fen', nargs='?', default=START_FEN)
+    parser.add_argument('-d', '--depth', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    position = Position(args.fen)
+    ai = AI(COLOR_NAMES[position.turn], depth=args.depth)
+    PROFILER.enable()
+    ai.find_best_move(position)
+    PROFILER.count('nodes', ai.nodes)
+    PROFILER.count('quiescence nodes', ai.quiescence_nodes)
+    table = ai.transposition_table.stats()
+    for name in ('hits', 'misses', 'overwrites'):
+        PROFILER.count(f'hash {name}', table[name])
+    PROFILER.disable()
+    ai.close()
+    print(PROFILER.report(args.json))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import argparse
+import ast
+import math
+import multiprocessing
+import os
+import random
+import time
+
+from ai import AI
+from pgn import move_to_san, format_game
+from position import Position, START_FEN, WHITE, BLACK, move_to_uci, parse_uci
+from tablebase import Tablebase, WIN, DRAW
+
+DEFAULT_DEPTH = 64  # an engine with only a time limit searches until the time is up
+DEFAULT_TIME_LIMIT = 0.1  # seconds per move of an engine with neither a depth nor a time limit
+
+
+def random_openings(count, plies, seed):
+    """ Short random move sequences from the start position, so the games do not all repeat each other """
+    rng = random.Random(seed)
+    openings = []
+    while len(openings) < count:
+        position = Position()
+        moves = []
+        for _ in range(plies):
+            legal_moves = position.legal_moves()
+            if not legal_moves:
+                break
+            move = rng.choice(legal_moves)
+            moves.append(move_to_uci(move))
+            position.push(move)
+        if position.legal_moves():
+            openings.append((START_FEN, moves))
+    return openings
+
+
+def read_openings(path):
+    """ One FEN or EPD position per line, the EPD operations after the fourth field are ignored """
+    openings = []
+    with open(path) as file:
+        for line in file:
+            fields = line.split(';')[0].split()
+            if len(fields) >= 4:
+                clocks = fields[4:6] if len(fields) >= 6 and fields[4].isdigit() else ['0', '1']
+                openings.append((' '.join(fields[:4] + clocks), []))
+    return openings
+
+
+def game_result(position, tablebase, max_plies):
+    """ Result and reason once the game is over, otherwise (None, None) """
+    if not position.legal_moves():
+        if position.in_check():
+            return ('0-1' if position.turn == WHITE else '1-0'), 'checkmate'
+        return '1/2-1/2', 'stalemate'
+    if position.is_repetition():
+        return '1/2-1/2', 'repetition'
+    if position.is_fifty_moves():
+        return '1/2-1/2', 'fifty-move rule'
+    result = tablebase.probe(position) if tablebase else None
+    if result is not None:
+        # the outcome is known, the game is adjudicated
+        outcome, _ = result
+        if outcome == DRAW:
+            return '1/2-1/2', 'tablebase'
+        winner = position.turn if outcome == WIN else position.turn ^ 1
+        return ('1-0' if winner == WHITE else '0-1'), 'tablebase'
+    if len(position.move_stack) >= max_plies:
+        return '1/2-1/2', 'move limit'
+    return None, None
+
+
+def play_game(task):
+    """ Plays one game in a worker process, returns the game number, result, reason and moves in SAN """
+    number, fen, opening, white_settings, black_settings, max_plies, tablebase_path = task
+    position = Position(fen)
+    sans = []
+    for text in opening:
+        move = parse_uci(text)
+        sans.append(move_to_san(position, move))
+        position.push(move)
+    players = {WHITE: AI('white', **white_settings), BLACK: AI('black', **black_settings)}
+    tablebase = Tablebase(tablebase_path) if tablebase_path else None
+    while True:
+        result, reason = game_result(position, tablebase, max_plies)
+        if result:
+            break
+        move = players[position.turn].find_best_move(position)
+        sans.append(move_to_san(position, move))
+        position.push(move)
+    for ai in players.values():
+        ai.close()
+    return number, result, reason, sans
+
+
+def elo_from_score(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def match_statistics(wins, draws, losses, elo0=0.0, elo1=5.0, alpha=0.05, beta=0.05):
+    """ Elo difference with a 95% interval and the log-likelihood ratio of the SPRT between elo0 and elo1,
+    using the normal approximation of the game results """
+    games = wins + draws + losses
+    statistics = {'games': games, 'wins': wins, 'draws': draws, 'losses': losses,
+                  'lower_bound': math.log(beta / (1 - alpha)), 'upper_bound': math.log((1 - beta) / alpha)}
+    if not games:
+        return dict(statistics, score=0.5, elo=0.0, error=math.inf, llr=0.0)
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    deviation = math.sqrt(variance / games)
+    statistics['score'] = score
+    statistics['elo'] = elo_from_score(score)
+    statistics['error'] = (elo_from_score(score + 1.96 * deviation) - elo_from_score(score - 1.96 * deviation)) / 2
+    if variance:
+        score0 = 1 / (1 + 10 ** (-elo0 / 400))
+        score1 = 1 / (1 + 10 ** (-elo1 / 400))
+        statistics['llr'] = games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+    else:
+        statistics['llr'] = 0.0
+    return statistics
+
+
+def report(statistics, sprt):
+    text = (f"games {statistics['games']}: +{statistics['wins']} ={statistics['draws']} -{statistics['losses']}  "
+            f"score {statistics['score']:.3f}  elo {statistics['elo']:+.1f} +/- {statistics['error']:.1f}")
+    if not sprt:
+        return text
+    text += f"  llr {statistics['llr']:.2f} [{statistics['lower_bound']:.2f}, {statistics['upper_bound']:.2f}]"
+    if statistics['llr'] >= statistics['upper_bound']:
+        text += '  H1 accepted'
+    elif statistics['llr'] <= statistics['lower_bound']:
+        text += '  H0 accepted'
+    return text
+
+
+def run_match(games, settings, names, openings, concurrency, max_plies, tablebase_path, pgn_path, sprt):
+    """ Plays the games in a process pool, every opening once with each side, results are counted for the first
+    engine. With sprt the match ends as soon as a bound is crossed """
+    tasks = []
+    for number in range(games):
+        fen, opening = openings[number // 2 % len(openings)]
+        first = number % 2  # the engines swap colors for every pair of games
+        tasks.append((number + 1, fen, opening, settings[first], settings[first ^ 1], max_plies, tablebase_path))
+
+    counts = {'wins': 0, 'draws': 0, 'losses': 0}
+    start_time = time.perf_counter()
+    pgn_file = open(pgn_path, 'a') if pgn_path else None
+    with multiprocessing.Pool(concurrency) as pool:
+        for number, result, reason, sans in pool.imap_unordered(play_game, tasks):
+            first = (number - 1) % 2
+            white, black = names[first], names[first ^ 1]
+            if result == '1/2-1/2':
+                counts['draws'] += 1
+            elif (result == '1-0') == (first == 0):
+                counts['wins'] += 1
+            else:
+                counts['losses'] += 1
+            if pgn_file:
+                fen = tasks[number - 1][1]
+                tags = {'Event': 'self-play', 'Site': '?', 'Date': time.strftime('%Y.%m.%d'), 'Round': number,
+                        'White': white, 'Black': black, 'Result': result, 'Termination': reason}
+                if fen != START_FEN:
+                    tags.update(SetUp='1', FEN=fen)
+                position = Position(fen)
+                pgn_file.write(format_game(tags, sans, result, position.full_move, position.turn == BLACK))
+                pgn_file.flush()
+            statistics = match_statistics(counts['wins'], counts['draws'], counts['losses'], *sprt)
+            print(f'game {number:>4} {white} vs {black}: {result} ({reason})  {report(statistics, sprt)}', flush=True)
+            if sprt and not statistics['lower_bound'] < statistics['llr'] < statistics['upper_bound']:
+                pool.terminate()
+                break
+    if pgn_file:
+        pgn_file.close()
+    statistics = match_statistics(counts['wins'], counts['draws'], counts['losses'], *sprt)
+    print(f'{names[0]} vs {names[1]} in {time.perf_counter() - start_time:.0f} s: {report(statistics, sprt)}')
+    return statistics
+
+
+def parse_settings(pairs):
+    """ AI keyword arguments from key=value pairs, values are Python literals such as 3, 0.5 or None.
+    Without a depth or a time limit an engine gets DEFAULT_TIME_LIMIT per move """
+    settings = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            settings[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            settings[key] = value
+    if 'depth' not in settings and 'time_limit' not in settings:
+        settings['time_limit'] = DEFAULT_TIME_LIMIT
+    settings.setdefault('depth', DEFAULT_DEPTH)
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays games between two AI settings without a display')
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('-c', '--concurrency', type=int, default=os.cpu_count() or 1, help='games played at once')
+    parser.add_argument('--engine1', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='AI settings of the tested engine, e.g. depth=4 time_limit=0.2')
+    parser.add_argument('--engine2', nargs='*', default=[], metavar='KEY=VALUE', help='AI settings of the baseline')
+    parser.add_argument('--names', nargs=2, default=['engine1', 'engine2'])
+    parser.add_argument('--openings', help='file with one FEN or EPD per line, random openings otherwise')
+    parser.add_argument('--opening-plies', type=int, default=6, help='length of the random openings')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-plies', type=int, default=400, help='longer games are drawn')
+    parser.add_argument('--tablebases', default=os.path.join('..', 'tablebases'),
+                        help='adjudicates the games once the endgame is in the tablebases')
+    parser.add_argument('--pgn', help='file the games are appended to')
+    parser.add_argument('--sprt', nargs=2, type=float, metavar=('ELO0', 'ELO1'),
+                        help='stop once the SPRT with alpha = beta = 0.05 accepts one of the hypotheses')
+    args = parser.parse_args()
+
+    if args.openings:
+        openings = read_openings(args.openings)
+    else:
+        openings = random_openings((args.games + 1) // 2, args.opening_plies, args.seed)
+    settings = [parse_settings(args.engine1), parse_settings(args.engine2)]
+    run_match(args.games, settings, args.names, openings, args.concurrency, args.max_plies, args.tablebases,
+              args.pgn, args.sprt or ())
+
+
+if __name__ == '__main__':
+    main()
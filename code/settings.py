@@ -1,3 +1,4 @@
+from os.path import join
 import pygame
 
 pygame.init()
@@ -5,6 +6,7 @@ pygame.init()
 WINDOW_WIDTH = WINDOW_HEIGHT = 896
 DIMENSION = 8
 TILE_SIZE = WINDOW_WIDTH//DIMENSION
+FPS = 60  # frame cap, an idle window does not redraw at all
 COLORS = {
     'text': '#ffffff',
     'board_light': '#f1d9c0',
@@ -15,8 +17,15 @@ COLORS = {
     'button_hover': '#646464'
 }
 
-START_FEN_BLACK = 'rnbkqbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBKQBNR w KQkq - 0 1'
-START_FEN_WHITE = 'RNBQKBNR/PPPPPPPP/8/8/8/8/pppppppp/rnbqkbnr w KQkq - 0 1'
+# ai search limits per move
+AI_MAX_DEPTH = 64
+AI_TIME_LIMIT = 2.0  # seconds
+AI_NODE_LIMIT = None
+AI_HASH_SIZE = 16  # MB for the transposition table of a game
+AI_WORKERS = 1  # processes searching root moves side by side, see parallel.py
+AI_QUIESCENCE_NODE_LIMIT = 1000  # capture search nodes per leaf of the main search
+AI_BOOK_PATH = join('..', 'books', 'book.bin')  # opening book, built with book.py, optional
+TABLEBASE_PATH = join('..', 'tablebases')  # endgame tables, generated with tablebase.py, optional
 
-CHESS_NOTATION_WHITE = {0: 'a', 1: 'b', 2: 'c', 3: 'd', 4: 'e', 5: 'f', 6: 'g', 7: 'h'}
-CHESS_NOTATION_BLACK = {7: 'a', 6: 'b', 5: 'c', 4: 'd', 3: 'e', 2: 'f', 1: 'g', 0: 'h'}
+# profiling of the hot paths with an on-screen display, toggled with F3 during a game, see profiler.py
+PROFILE = False
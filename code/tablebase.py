@@ -0,0 +1,256 @@
+import argparse
+import os
+import time
+import zlib
+
+from bitboard import KING_ATTACKS, PAWN_ATTACKS, rook_attacks, queen_attacks
+from position import Position, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+
+# every table covers the strong side's king and one piece against the bare king, with white as the strong side.
+# a position is stored in one byte at ((side to move * 64 + white king) * 64 + black king) * 64 + piece square:
+# 0 is a draw or an illegal position, otherwise the byte is the distance to mate in plies plus one.
+# an odd distance is a win for the side to move, an even one a loss
+TABLES = {'KQK': QUEEN, 'KRK': ROOK, 'KPK': PAWN}
+TABLE_SIZE = 2 * 64 * 64 * 64
+DRAWN_PIECES = (KNIGHT, BISHOP)  # a single minor piece cannot mate
+
+WIN, DRAW, LOSS = 1, 0, -1
+
+
+def table_index(turn, white_king, black_king, square):
+    return ((turn * 64 + white_king) * 64 + black_king) * 64 + square
+
+
+def piece_attacks(piece_type, square, occupied):
+    """ Squares the white piece attacks """
+    if piece_type == QUEEN:
+        return queen_attacks(square, occupied)
+    if piece_type == ROOK:
+        return rook_attacks(square, occupied)
+    return PAWN_ATTACKS[WHITE][square]
+
+
+def is_legal(turn, white_king, black_king, square, piece_type):
+    """ Distinct squares, no pawn on the first or last rank and the side that just moved is not in check """
+    if white_king == black_king or square in (white_king, black_king):
+        return False
+    if KING_ATTACKS[white_king] >> black_king & 1:
+        return False
+    if piece_type == PAWN and not 8 <= square < 56:
+        return False
+    occupied = (1 << white_king) | (1 << black_king) | (1 << square)
+    return turn == BLACK or not piece_attacks(piece_type, square, occupied) >> black_king & 1
+
+
+def generate_moves(turn, white_king, black_king, square, piece_type):
+    """ Legal moves of a position as (kind, target) pairs: ('king', square), ('piece', square),
+    ('promotion', (piece type, square)) or ('capture', square) when the black king takes the piece """
+    occupied = (1 << white_king) | (1 << black_king) | (1 << square)
+    moves = []
+    if turn == WHITE:
+        attacks = piece_attacks(piece_type, square, occupied)
+        targets = KING_ATTACKS[white_king] & ~KING_ATTACKS[black_king] & ~(1 << square)
+        while targets:
+            low_bit = targets & -targets
+            moves.append(('king', low_bit.bit_length() - 1))
+            targets ^= low_bit
+        if piece_type == PAWN:
+            targets = []
+            if not occupied >> (square + 8) & 1:
+                targets.append(square + 8)
+                if 8 <= square < 16 and not occupied >> (square + 16) & 1:
+                    targets.append(square + 16)
+            for target in targets:
+                if target >= 56:
+                    moves += [('promotion', (promotion, target)) for promotion in (QUEEN, ROOK, BISHOP, KNIGHT)]
+                else:
+                    moves.append(('piece', target))
+        else:
+            targets = attacks & ~occupied
+            while targets:
+                low_bit = targets & -targets
+                moves.append(('piece', low_bit.bit_length() - 1))
+                targets ^= low_bit
+        return moves
+
+    # the black king may take the piece when the white king does not protect it
+    targets = KING_ATTACKS[black_king] & ~KING_ATTACKS[white_king]
+    while targets:
+        low_bit = targets & -targets
+        target = low_bit.bit_length() - 1
+        targets ^= low_bit
+        if target == square:
+            moves.append(('capture', target))
+        elif not piece_attacks(piece_type, square, occupied ^ (1 << black_king)) >> target & 1:
+            moves.append(('king', target))
+    return moves
+
+
+def unmove_targets(turn, white_king, black_king, square, piece_type):
+    """ Positions one move earlier inside the same table, the side to move there is the other one """
+    occupied = (1 << white_king) | (1 << black_king) | (1 << square)
+    previous = []
+    if turn == BLACK:
+        # white moved: back with the king, or the piece back along its lines or pawn pushes
+        targets = KING_ATTACKS[white_king] & ~occupied
+        while targets:
+            low_bit = targets & -targets
+            previous.append((low_bit.bit_length() - 1, black_king, square))
+            targets ^= low_bit
+        if piece_type == PAWN:
+            if square >= 16 and not occupied >> (square - 8) & 1:
+                previous.append((white_king, black_king, square - 8))
+                if 24 <= square < 32 and not occupied >> (square - 16) & 1:
+                    previous.append((white_king, black_king, square - 16))
+        else:
+            targets = piece_attacks(piece_type, square, occupied) & ~occupied
+            while targets:
+                low_bit = targets & -targets
+                previous.append((white_king, black_king, low_bit.bit_length() - 1))
+                targets ^= low_bit
+    else:
+        targets = KING_ATTACKS[black_king] & ~occupied
+        while targets:
+            low_bit = targets & -targets
+            previous.append((white_king, low_bit.bit_length() - 1, square))
+            targets ^= low_bit
+    return [(white_king, black_king, square) for white_king, black_king, square in previous
+            if is_legal(turn ^ 1, white_king, black_king, square, piece_type)]
+
+
+def generate_table(piece_type, tables):
+    """ Retrograde analysis: starting from the mates, wins and losses are spread backwards one ply at a time.
+    A position is lost once every move leads to a win of the opponent, counted down per position """
+    values = bytearray(TABLE_SIZE)
+    counters = [0] * TABLE_SIZE
+    levels = {0: []}
+    for index in range(TABLE_SIZE):
+        turn, white_king, black_king, square = index >> 18, (index >> 12) & 63, (index >> 6) & 63, index & 63
+        if not is_legal(turn, white_king, black_king, square, piece_type):
+            continue
+        moves = generate_moves(turn, white_king, black_king, square, piece_type)
+        count = 0
+        drawn_exit = False
+        for kind, target in moves:
+            if kind == 'capture':
+                drawn_exit = True
+            elif kind == 'promotion':
+                promotion, to_square = target
+                if promotion in DRAWN_PIECES:
+                    drawn_exit = True
+                    continue
+                # the promoted position is in the queen or rook table with black to move
+                value = tables[promotion][table_index(BLACK, white_king, black_king, to_square)]
+                if value and (value - 1) % 2 == 0:
+                    levels.setdefault(value, []).append(index)  # black is mated in value - 1 plies
+                else:
+                    drawn_exit = True
+            else:
+                count += 1
+        if not moves:
+            opponent_attacks = (piece_attacks(piece_type, square, (1 << white_king) | (1 << square))
+                                | KING_ATTACKS[white_king])
+            if turn == BLACK and opponent_attacks >> black_king & 1:
+                levels[0].append(index)  # checkmate
+            continue
+        counters[index] = count + drawn_exit  # a drawing exit keeps the position from ever being lost
+
+    distance = 0
+    while levels:
+        for index in levels.pop(distance, []):
+            if values[index]:
+                continue
+            values[index] = distance + 1
+            turn, white_king, black_king, square = index >> 18, (index >> 12) & 63, (index >> 6) & 63, index & 63
+            for previous in unmove_targets(turn, white_king, black_king, square, piece_type):
+                previous_index = table_index(turn ^ 1, *previous)
+                if values[previous_index]:
+                    continue
+                if distance % 2 == 0:
+                    # the position is lost, so the side that moves into it wins
+                    levels.setdefault(distance + 1, []).append(previous_index)
+                else:
+                    counters[previous_index] -= 1
+                    if not counters[previous_index]:
+                        levels.setdefault(distance + 1, []).append(previous_index)
+        distance += 1
+    return values
+
+
+def generate_tables(directory):
+    """ Generates every table, the pawn table needs the queen and rook tables for its promotions """
+    os.makedirs(directory, exist_ok=True)
+    tables = {}
+    for name, piece_type in TABLES.items():
+        start_time = time.perf_counter()
+        tables[piece_type] = generate_table(piece_type, tables)
+        data = zlib.compress(bytes(tables[piece_type]), 9)
+        with open(os.path.join(directory, f'{name}.bin'), 'wb') as file:
+            file.write(data)
+        print(f'{name}: {len(data)} bytes in {time.perf_counter() - start_time:.1f} s')
+
+
+class Tablebase:
+    """ Prober for the generated tables, a table is read from disk the first time it is needed """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+
+    def table(self, piece_type):
+        if piece_type not in self.tables:
+            name = next(name for name, table_piece in TABLES.items() if table_piece == piece_type)
+            path = os.path.join(self.directory, f'{name}.bin')
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    self.tables[piece_type] = zlib.decompress(file.read())
+            else:
+                self.tables[piece_type] = None
+        return self.tables[piece_type]
+
+    def probe(self, position):
+        """ Exact (result, plies to mate) for the side to move, a draw is (DRAW, 0).
+        None when the material is not covered or the table is missing """
+        occupied = position.colors[WHITE] | position.colors[BLACK]
+        if bin(occupied).count('1') > 3 or position.castling:
+            return None
+        pieces = [(square, piece) for square, piece in enumerate(position.squares)
+                  if piece is not None and piece % 6 != KING]
+        if not pieces:
+            return DRAW, 0
+        square, piece = pieces[0]
+        piece_type = piece % 6
+        if piece_type in DRAWN_PIECES:
+            return DRAW, 0
+        white_king, black_king = position.king_square(WHITE), position.king_square(BLACK)
+        turn = position.turn
+        if piece // 6 == BLACK:
+            # mirror the board so the strong side is white
+            white_king, black_king, square, turn = black_king ^ 56, white_king ^ 56, square ^ 56, turn ^ 1
+        table = self.table(piece_type)
+        if table is None:
+            return None
+        value = table[table_index(turn, white_king, black_king, square)]
+        if not value:
+            return DRAW, 0
+        return (WIN if (value - 1) % 2 else LOSS), value - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generates the endgame tablebases or probes a position')
+    parser.add_argument('fen', nargs='?', help='position to probe, the tables are generated without one')
+    parser.add_argument('--directory', default=os.path.join('..', 'tablebases'))
+    args = parser.parse_args()
+    if args.fen:
+        result = Tablebase(args.directory).probe(Position(args.fen))
+        if result is None:
+            print('not in the tablebases')
+        else:
+            outcome, distance = result
+            print({WIN: 'win', DRAW: 'draw', LOSS: 'loss'}[outcome], f'mate in {distance} plies' if outcome else '')
+    else:
+        generate_tables(args.directory)
+
+
+if __name__ == '__main__':
+    main()
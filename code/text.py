@@ -1,10 +1,18 @@
+from functools import lru_cache
+
 from settings import *
 
 
+@lru_cache(maxsize=64)
+def render_text(text, font, color):
+    """ Rendered text surfaces, the same few messages are drawn every frame """
+    return font.render(text, True, color)
+
+
 def draw_text_box(screen, text, position, font, size=36, padding=10, border_radius=10):
     """ Draws text with a background rectangle on the given screen """
-    # Render the text surface
-    text_surface = font.render(text, True, COLORS['text'])
+    # Render the text surface, or reuse it when it was rendered before
+    text_surface = render_text(text, font, COLORS['text'])
 
     # Get the size of the text surface and calculate the background rect
     text_rect = text_surface.get_rect()
@@ -0,0 +1,85 @@
+from array import array
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 1, 2, 3
+
+# every entry is a 64-bit key and a 64-bit data word, a bucket holds a depth-preferred and an always-replace entry
+ENTRY_BYTES = 16
+BUCKET_ENTRIES = 2
+
+# data word layout: move (16 bits) | bound (2 bits) | depth (8 bits) | score + SCORE_OFFSET (32 bits)
+SCORE_OFFSET = 1 << 31
+
+
+class TranspositionTable:
+    """ Fixed-size hash table of search results, the memory is allocated once and never grows """
+
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        self.bucket_count = max(1, size_mb * 1024 * 1024 // (ENTRY_BYTES * BUCKET_ENTRIES))
+        self.keys = array('Q', [0]) * (self.bucket_count * BUCKET_ENTRIES)
+        self.data = array('Q', [0]) * (self.bucket_count * BUCKET_ENTRIES)
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.overwrites = 0
+        self.stores = 0
+
+    def clear(self):
+        """ Empties the table, the new arrays have the same size """
+        self.keys = array('Q', [0]) * len(self.keys)
+        self.data = array('Q', [0]) * len(self.data)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.overwrites = 0
+        self.stores = 0
+
+    def probe(self, key):
+        """ Returns (depth, score, bound, move) stored for the key or None """
+        index = (key % self.bucket_count) * BUCKET_ENTRIES
+        keys = self.keys
+        if keys[index] == key:
+            data = self.data[index]
+        elif keys[index + 1] == key:
+            data = self.data[index + 1]
+        else:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return (data >> 18) & 0xFF, (data >> 26) - SCORE_OFFSET, (data >> 16) & 3, data & 0xFFFF
+
+    def store(self, key, depth, score, bound, move):
+        """ Deeper results stay in the depth-preferred slot, everything else goes to the always-replace slot """
+        index = (key % self.bucket_count) * BUCKET_ENTRIES
+        keys = self.keys
+        data = move | (bound << 16) | (depth << 18) | ((score + SCORE_OFFSET) << 26)
+        if keys[index] == key or depth >= (self.data[index] >> 18) & 0xFF:
+            if keys[index] != key and keys[index]:
+                self.overwrites += 1
+        else:
+            index += 1
+            if keys[index] != key and keys[index]:
+                self.overwrites += 1
+        keys[index] = key
+        self.data[index] = data
+        self.stores += 1
+
+    def usage(self):
+        """ Filled share of the first thousand entries in permille, the UCI hashfull value """
+        sample = min(1000, len(self.keys))
+        return sum(1 for index in range(sample) if self.keys[index]) * 1000 // sample
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'size_mb': self.size_mb,
+            'entries': len(self.keys),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / probes if probes else 0.0,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+        }
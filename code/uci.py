@@ -0,0 +1,243 @@
+import sys
+import threading
+
+from ai import AI, MATE_BOUND, MATE_SCORE
+from position import Position, START_FEN, COLOR_NAMES, move_to_uci, parse_uci
+
+ENGINE_NAME = 'Chess'
+ENGINE_AUTHOR = 'linusheimbs'
+MAX_DEPTH = 64
+
+# name: (uci type, default, minimum, maximum), the values are passed on to the AI by OPTION_SETTINGS
+OPTIONS = {
+    'Hash': ('spin', 16, 1, 4096),
+    'Threads': ('spin', 1, 1, 256),
+    'BookFile': ('string', '', None, None),
+    'TablebasePath': ('string', '', None, None),
+}
+OPTION_SETTINGS = {'Hash': 'hash_size', 'Threads': 'workers', 'BookFile': 'book_path',
+                   'TablebasePath': 'tablebase_path'}
+
+
+def format_score(score):
+    """ Centipawns, or moves to mate which are negative when the engine gets mated """
+    if score > MATE_BOUND:
+        return f'mate {(MATE_SCORE - score + 1) // 2}'
+    if score < -MATE_BOUND:
+        return f'mate -{(MATE_SCORE + score) // 2}'
+    return f'cp {score}'
+
+
+def time_for_move(remaining, increment, moves_to_go):
+    """ Seconds for the next move of a clock given in milliseconds """
+    seconds = remaining / 1000 / (moves_to_go or 30) + increment / 1000 * 0.8
+    return max(0.01, min(seconds, remaining / 1000 / 2))
+
+
+class UCI:
+    """ Universal Chess Interface on stdin and stdout, the search runs in a thread so stop is handled at once """
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.position = Position()
+        self.options = {name: option[1] for name, option in OPTIONS.items()}
+        self.ai = None
+        self.stop_event = threading.Event()
+        self.search_thread = None
+        self.infinite = False
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def create_ai(self):
+        """ The AI is built again when an option changes, its transposition table lives as long as it does """
+        if self.ai:
+            self.ai.close()
+        settings = {OPTION_SETTINGS[name]: value or None for name, value in self.options.items()}
+        if settings['workers'] > 1:
+            from parallel import ParallelAI  # starts processes, only needed with more than one thread
+            self.ai = ParallelAI('white', depth=MAX_DEPTH, **settings)
+        else:
+            del settings['workers']
+            self.ai = AI('white', depth=MAX_DEPTH, **settings)
+        self.ai.stop_event = self.stop_event
+        self.ai.info_callback = self.send_info
+
+    def send_info(self, info):
+        pv = ' '.join(move_to_uci(move) for move in info['pv'])
+        nodes = info['nodes'] + info['quiescence_nodes']
+        self.send(f"info depth {info['depth']} score {format_score(info['score'])} nodes {nodes} "
+                  f"nps {info['nps']} time {int(info['time'] * 1000)} "
+                  f"hashfull {self.ai.transposition_table.usage()} pv {pv}")
+
+    def handle(self, line):
+        """ Runs one command, returns False on quit """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send(f'id author {ENGINE_AUTHOR}')
+            for name, (option_type, default, minimum, maximum) in OPTIONS.items():
+                if option_type == 'spin':
+                    self.send(f'option name {name} type spin default {default} min {minimum} max {maximum}')
+                else:
+                    self.send(f'option name {name} type string default {default or "<empty>"}')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.stop_search()
+            self.set_option(arguments)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            if self.ai:
+                self.ai.transposition_table.clear()
+                self.ai.history = [0] * len(self.ai.history)
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(arguments)
+        elif command == 'go':
+            self.stop_search()
+            self.go(arguments)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'ponderhit':
+            pass  # pondering is not supported, the search simply continues
+        elif command == 'quit':
+            self.stop_search()
+            if self.ai:
+                self.ai.close()
+            return False
+        elif command == 'd':
+            self.send(self.position.fen())
+        else:
+            self.send(f'info string unknown command {command}')
+        return True
+
+    def set_option(self, arguments):
+        """ setoption name <name> [value <value>], names may contain spaces """
+        if 'name' not in arguments:
+            return
+        if 'value' in arguments:
+            value_index = arguments.index('value')
+            name = ' '.join(arguments[arguments.index('name') + 1:value_index])
+            value = ' '.join(arguments[value_index + 1:])
+        else:
+            name = ' '.join(arguments[arguments.index('name') + 1:])
+            value = ''
+        option = next((option_name for option_name in OPTIONS if option_name.lower() == name.lower()), None)
+        if option is None:
+            self.send(f'info string unknown option {name}')
+            return
+        option_type, _, minimum, maximum = OPTIONS[option]
+        if option_type == 'spin':
+            try:
+                value = max(minimum, min(maximum, int(value)))
+            except ValueError:
+                self.send(f'info string invalid value {value} for {option}')
+                return
+        elif value == '<empty>':
+            value = ''
+        if self.options[option] != value:
+            self.options[option] = value
+            if self.ai:
+                self.create_ai()
+
+    def set_position(self, arguments):
+        """ position startpos | fen <fen> [moves <move> ...] """
+        if 'moves' in arguments:
+            moves_index = arguments.index('moves')
+            setup, moves = arguments[:moves_index], arguments[moves_index + 1:]
+        else:
+            setup, moves = arguments, []
+        try:
+            position = Position(' '.join(setup[1:]) if setup and setup[0] == 'fen' else START_FEN)
+        except (ValueError, IndexError, KeyError):
+            self.send(f"info string invalid position {' '.join(setup)}")
+            return  # the previous position is kept
+        for text in moves:
+            try:
+                move = parse_uci(text)
+            except (ValueError, IndexError):
+                move = None
+            if move not in position.legal_moves():
+                self.send(f'info string illegal move {text}')
+                break
+            position.push(move)
+        self.position = position
+
+    def go(self, arguments):
+        """ go [depth d] [movetime ms] [wtime ms btime ms winc ms binc ms movestogo n] [nodes n] [infinite] """
+        limits = {}
+        index = 0
+        while index < len(arguments):
+            if arguments[index] == 'infinite':
+                limits['infinite'] = True
+                index += 1
+            elif arguments[index] in ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo', 'nodes'):
+                try:
+                    limits[arguments[index]] = int(arguments[index + 1])
+                except (IndexError, ValueError):
+                    self.send(f'info string invalid value for {arguments[index]}')  # the limit is ignored
+                index += 2
+            else:
+                index += 1  # searchmoves, ponder and mate are not supported
+
+        if self.ai is None:
+            self.create_ai()
+        ai = self.ai
+        ai.color = COLOR_NAMES[self.position.turn]
+        ai.depth = limits.get('depth', MAX_DEPTH)
+        ai.node_limit = limits.get('nodes')
+        ai.time_limit = None
+        clock = 'wtime' if self.position.white_to_move else 'btime'
+        increment = 'winc' if self.position.white_to_move else 'binc'
+        if 'movetime' in limits:
+            ai.time_limit = limits['movetime'] / 1000
+        elif clock in limits:
+            ai.time_limit = time_for_move(limits[clock], limits.get(increment, 0), limits.get('movestogo'))
+        self.infinite = limits.get('infinite', False)
+
+        self.stop_event.clear()
+        self.search_thread = threading.Thread(target=self.search, args=(self.position.copy(),), daemon=True)
+        self.search_thread.start()
+
+    def search(self, position):
+        ai = self.ai
+        move = None
+        try:
+            ai.pos_evaluated_count = 0
+            move = ai.find_best_move(position)
+            if self.infinite:
+                self.stop_event.wait()  # the best move of an infinite search is only sent after stop
+            info = ai.search_info()
+            if move is not None and not ai.completed_depth and not ai.book_move and not ai.tablebase_move:
+                self.send_info(info)  # stopped before the first iteration finished
+            table = info['hash']
+            self.send(f"info string hash hits {table['hits']} misses {table['misses']} "
+                      f"hit rate {table['hit_rate']:.1%} overwrites {table['overwrites']}")
+        finally:
+            # the GUI waits for a bestmove, so one is sent even when the search failed
+            self.send(f'bestmove {move_to_uci(move)}' if move is not None else 'bestmove 0000')
+
+    def stop_search(self):
+        """ Ends a running search and waits for its bestmove """
+        if self.search_thread and self.search_thread.is_alive():
+            self.stop_event.set()
+            self.search_thread.join()
+        self.search_thread = None
+
+    def run(self, stream=sys.stdin):
+        for line in stream:
+            if not self.handle(line):
+                break
+        self.stop_search()
+
+
+if __name__ == '__main__':
+    UCI().run()
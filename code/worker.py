@@ -0,0 +1,113 @@
+import multiprocessing
+
+from ai import AI
+from profiler import PROFILER
+
+
+class StopSignal:
+    """ Tells the search in the worker whether its search id was asked to stop """
+
+    def __init__(self, stop_id):
+        self.stop_id = stop_id  # shared value, the highest search id that has to stop
+        self.search_id = 0
+
+    def is_set(self):
+        return self.stop_id.value >= self.search_id
+
+
+def run_search_worker(connection, stop_id, color, ai_settings):
+    """ Worker process loop: receives positions, searches them and sends back the search info """
+    workers = ai_settings.pop('workers', 1)
+    if workers > 1:
+        from parallel import ParallelAI  # imported here, parallel.py uses the StopSignal of this module
+        ai = ParallelAI(color, workers=workers, **ai_settings)
+    else:
+        ai = AI(color, **ai_settings)
+    ai.stop_event = StopSignal(stop_id)
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        ai.stop_event.search_id, position, profile = request
+        if profile != PROFILER.enabled:
+            # the game switches the profiling of both processes together, a new session starts from zero
+            if PROFILER.toggle():
+                PROFILER.reset()
+        ai.pos_evaluated_count = 0
+        ai.find_best_move(position)
+        info = ai.search_info()
+        if profile:
+            PROFILER.count('nodes', info['nodes'] + info['quiescence_nodes'])
+            for name in ('hits', 'misses', 'overwrites'):
+                PROFILER.count(f'hash {name}', info['hash'][name])
+            info['profile'] = PROFILER.stats()
+        connection.send(info)
+    ai.close()
+
+
+class SearchWorker:
+    """ Runs the AI search in its own process, so the window keeps drawing and handling events """
+
+    def __init__(self, color, **ai_settings):
+        self.stop_id = multiprocessing.Value('i', 0)
+        self.connection, child_connection = multiprocessing.Pipe()
+        # a daemon process may not start the pool of a parallel search
+        self.process = multiprocessing.Process(target=run_search_worker,
+                                               args=(child_connection, self.stop_id, color, ai_settings),
+                                               daemon=ai_settings.get('workers', 1) <= 1)
+        self.process.start()
+        self.search_id = 0
+        self.pending = 0  # searches sent to the worker whose results did not arrive yet
+        self.cancelled = 0  # pending searches whose results are thrown away
+        self.last_info = None
+
+    @property
+    def searching(self):
+        return self.pending > 0
+
+    @property
+    def thinking(self):
+        """ A search whose result is still wanted is running """
+        return self.pending > self.cancelled
+
+    def start(self, position, profile=False):
+        """ Starts searching the position, it is copied when sent to the worker """
+        self.search_id += 1
+        self.connection.send((self.search_id, position, profile))
+        self.pending += 1
+
+    def poll(self):
+        """ Returns the search info once the search is done, None while it is still running """
+        while self.pending and self.connection.poll():
+            info = self.connection.recv()
+            self.pending -= 1
+            if self.cancelled:
+                self.cancelled -= 1
+                continue
+            self.last_info = info
+            return info
+        return None
+
+    def stop(self):
+        """ Asks the search to finish now, its best move so far arrives with the next poll """
+        self.stop_id.value = self.search_id
+
+    def cancel(self):
+        """ Stops the search and ignores its result, e.g. when the position was changed by an undo """
+        if self.thinking:
+            self.cancelled += 1
+            self.stop()
+
+    def close(self):
+        """ Ends the worker process without waiting for a running search """
+        self.stop()
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -0,0 +1,23 @@
+import random
+
+# fixed seed so that hashes stay the same between runs and processes
+_random = random.Random(0x5EED)
+
+PIECE_KEYS = [[_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+SIDE_KEY = _random.getrandbits(64)  # xored in when black is to move
+CASTLING_KEYS = [_random.getrandbits(64) for _ in range(16)]  # one per combination of castling rights
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]  # by file of the en-passant square
+
+
+def compute_hash(position):
+    """ Computes the 64-bit Zobrist key of a position from scratch """
+    key = 0
+    for square, piece in enumerate(position.squares):
+        if piece is not None:
+            key ^= PIECE_KEYS[piece][square]
+    if position.turn:
+        key ^= SIDE_KEY
+    key ^= CASTLING_KEYS[position.castling]
+    if position.en_passant is not None:
+        key ^= EN_PASSANT_KEYS[position.en_passant % 8]
+    return key